@@ -0,0 +1,169 @@
+import argparse
+import csv
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from multiprocessing import Pool
+
+from config import Config
+from emul.corpus import Corpus, pack
+from emul.coverage import matrix
+from emul.cpu import UnknownOpcode, StackOverflow, StackUnderflow, PcOverflow
+from emul.headless import Headless
+from emul.system import System
+
+# corpora opened by this process, by path
+corpora = {}
+
+def run_rom(job):
+	path, cycles, cfg = job
+	with open(path, 'rb') as f:
+		rom = f.read()
+	return run(os.path.basename(path), rom, cycles, cfg)
+
+def run_corpus_rom(job):
+	# workers map each corpus once and load roms straight from it
+	path, name, cycles, cfg = job
+	corpus = corpora.get(path)
+	if corpus is None:
+		corpus = corpora[path] = Corpus(path)
+	return run(name, corpus[name], cycles, cfg)
+
+def run(name, rom, cycles, cfg):
+	rec = {
+		'rom'             : name,
+		'cycles'          : 0,
+		'wall'            : 0.0,
+		'fb'              : None,
+		'unknown_opcodes' : 0,
+		'stack_overflows' : 0,
+		'stack_underflows': 0,
+		'pc_overflows'    : 0,
+		'fault'           : None,
+		'key_wait'        : False,
+	}
+
+	# runs are compared by their framebuffer hash, so random numbers and
+	# timers must not depend on the host
+	cfg = dict(cfg, cpu_deterministic=True)
+	cfg.setdefault('cpu_seed', 0)
+
+	# with no input scripted a key wait can't be satisfied; the backend
+	# ends the run there and it is reported as key_wait
+	backend = Headless()
+	with System(backend=backend, **cfg) as emu:
+		t = time.perf_counter()
+		try:
+			emu.start(rom, cycles)
+		except UnknownOpcode as e:
+			rec['unknown_opcodes'] += 1
+			rec['fault'] = str(e)
+		except StackOverflow as e:
+			rec['stack_overflows'] += 1
+			rec['fault'] = str(e)
+		except StackUnderflow as e:
+			rec['stack_underflows'] += 1
+			rec['fault'] = str(e)
+		except PcOverflow as e:
+			rec['pc_overflows'] += 1
+			rec['fault'] = str(e)
+		except ValueError as e:
+			# too large for ram
+			rec['fault'] = str(e)
+		except Exception as e:
+			# any other breakage
+			rec['fault'] = '%s: %s'%(type(e).__name__, e)
+		rec['wall'] = time.perf_counter() - t
+		rec['cycles'] = emu.cpu.cycles
+		rec['key_wait'] = any(e == 'keywait' for _, e in backend.events)
+		rec['fb'] = hashlib.sha1(emu.gfx.pack()).hexdigest()
+		if emu.cpu.coverage:
+			rec['coverage'] = emu.cpu.coverage.report()
+
+	return rec
+
+def run_all(paths, cycles, cfg, jobs=None):
+	with Pool(jobs) as pool:
+		return pool.map(run_rom, [(p, cycles, cfg) for p in paths])
+
+def run_corpus(path, cycles, cfg, jobs=None):
+	with Corpus(path) as corpus:
+		names = list(corpus)
+	with Pool(jobs) as pool:
+		return pool.map(run_corpus_rom, [(path, n, cycles, cfg) for n in names], chunksize=64)
+
+def write_matrix(path, recs):
+	# one row per rom with its fault and a column per handler and outcome
+	head, rows = matrix((r['rom'], r['coverage']) for r in recs)
+	with open(path, 'w', newline='') as f:
+		out = csv.writer(f)
+		out.writerow(head)
+		out.writerows(rows)
+
+def list_roms(path):
+	return sorted(
+		os.path.join(path, name) for name in os.listdir(path)
+		if os.path.isfile(os.path.join(path, name)))
+
+def main():
+	logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+	parser = argparse.ArgumentParser(description='Run a directory or corpus of ROMs headless')
+	parser.add_argument('roms', help='directory of ROM files or a corpus file')
+	parser.add_argument('-c', '--cycles', type=int, help='instructions to run per ROM')
+	parser.add_argument('-f', '--frames', type=int, help='frames to run per ROM')
+	parser.add_argument('-j', '--jobs', type=int, help='worker processes (default: cpu count)')
+	parser.add_argument('-o', '--out', help='JSON lines output (default: stdout)')
+	parser.add_argument('--pack', metavar='CORPUS', help='pack the ROM directory into a corpus file and exit')
+	parser.add_argument('-s', '--seed', type=int, default=0, help='random seed for every ROM')
+	parser.add_argument('--coverage', action='store_true', help='record opcode coverage per ROM')
+	parser.add_argument('--matrix', help='write the coverage of all ROMs as a CSV compatibility matrix')
+	args = parser.parse_args()
+
+	cfg = Config().as_dict()
+	cfg['sys_backend'] = 'headless'
+	cfg['cpu_throttle'] = False
+	cfg['cpu_deterministic'] = True
+	cfg['cpu_seed'] = args.seed
+	cfg['cpu_coverage'] = args.coverage or bool(args.matrix)
+
+	if args.pack:
+		limit = cfg.get('ram_sz', 4096) - cfg.get('cpu_ld_addr', 0x200)
+		paths = list_roms(args.roms)
+		roms = []
+		for p in paths:
+			with open(p, 'rb') as f:
+				roms.append((os.path.basename(p), f.read()))
+		pack(args.pack, roms, limit)
+		logging.info('packed %d roms into %s', len(roms), args.pack)
+		return
+
+	cycles = args.cycles
+	if args.frames is not None:
+		cycles = args.frames * cfg['cpu_ips'] // cfg.get('cpu_frame_hz', 60)
+	if cycles is None:
+		parser.error('one of --cycles or --frames is required')
+
+	if os.path.isdir(args.roms):
+		recs = run_all(list_roms(args.roms), cycles, cfg, args.jobs)
+	else:
+		recs = run_corpus(args.roms, cycles, cfg, args.jobs)
+
+	if args.matrix:
+		write_matrix(args.matrix, recs)
+
+	out = open(args.out, 'w') if args.out else sys.stdout
+	try:
+		for rec in recs:
+			out.write(json.dumps(rec, sort_keys=True) + '\n')
+	finally:
+		if out is not sys.stdout:
+			out.close()
+
+	logging.info('%d roms, %d faults', len(recs), sum(1 for r in recs if r['fault']))
+
+if __name__ == '__main__':
+		main()
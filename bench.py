@@ -0,0 +1,114 @@
+import argparse
+import gc
+import json
+import logging
+import sys
+import time
+import tracemalloc
+
+from emul.headless import Headless
+from emul.system import System
+
+def asm(*codes):
+	return b''.join(code.to_bytes(2, 'big') for code in codes)
+
+# synthetic workloads; each one loops forever from 0x200
+roms = {
+	# arithmetic and logic on registers
+	'alu': asm(0x6001, 0x7103, 0x8014, 0x8125, 0x8206, 0x830e, 0x8434, 0x8510, 0x1200),
+	# font sprites drawn across the screen with wrap-around
+	'sprite': asm(0xa000, 0xd015, 0x7005, 0x7103, 0x1202),
+	# bulk register stores and loads
+	'memcpy': asm(0xa300, 0xff55, 0xff65, 0xa400, 0xff55, 0xff65, 0x1200),
+	# recursion 16 calls deep
+	'call': asm(0x6000, 0x2206, 0x1200, 0x7001, 0x3010, 0x2206, 0x00ee),
+	# decimal conversion of changing values
+	'bcd': asm(0xa300, 0xf033, 0x7007, 0xf133, 0x7103, 0x1202),
+}
+
+def run(name, count, cfg):
+	# one run through CPU.run; frames are long so that the scheduler
+	# does not dominate
+	cfg = dict(cfg, cpu_throttle=False, cpu_deterministic=True)
+	cfg.setdefault('cpu_ips', 60000)
+
+	emu = System(backend=Headless(), **cfg)
+	emu.load(roms[name])
+
+	gc.collect()
+	blocks = sys.getallocatedblocks()
+	t = time.perf_counter_ns()
+	emu.cpu.run(0x200, count)
+	ns = time.perf_counter_ns() - t
+	blocks = sys.getallocatedblocks() - blocks
+
+	return {
+		'instructions': emu.cpu.cycles,
+		'mips': emu.cpu.cycles / ns * 1e3,
+		'ns_per_ins': ns / emu.cpu.cycles,
+		'blocks_per_ins': blocks / emu.cpu.cycles,
+	}
+
+def peak(name, count, cfg):
+	# bytes of peak traced memory while running; slow, so run separately
+	tracemalloc.start()
+	try:
+		run(name, count, cfg)
+		return tracemalloc.get_traced_memory()[1]
+	finally:
+		tracemalloc.stop()
+
+def bench(count, cfg, repeat=3, names=None):
+	results = {}
+	for name in names or sorted(roms):
+		best = min((run(name, count, cfg) for _ in range(repeat)), key=lambda r: r['ns_per_ins'])
+		best['peak_bytes'] = peak(name, min(count, 10000), cfg)
+		results[name] = best
+	return results
+
+def compare(results, baseline, tolerance=0.1):
+	# workloads whose ns per instruction grew by more than tolerance
+	slower = {}
+	for name, rec in results.items():
+		base = baseline.get(name)
+		if base and rec['ns_per_ins'] > base['ns_per_ins'] * (1 + tolerance):
+			slower[name] = rec['ns_per_ins'] / base['ns_per_ins']
+	return slower
+
+def main():
+	logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+	parser = argparse.ArgumentParser(description='Benchmark the emulator core on synthetic ROMs')
+	parser.add_argument('names', nargs='*', help='workloads to run (default: all of %s)' % ', '.join(sorted(roms)))
+	parser.add_argument('-n', '--count', type=int, default=200000, help='instructions per run')
+	parser.add_argument('-r', '--repeat', type=int, default=3, help='runs per workload, the best is kept')
+	parser.add_argument('--jit', action='store_true', help='use the block compiler')
+	parser.add_argument('-o', '--out', help='write results as JSON')
+	parser.add_argument('-b', '--baseline', help='JSON results to compare against')
+	parser.add_argument('-t', '--tolerance', type=float, default=0.1, help='allowed slowdown against the baseline')
+	args = parser.parse_args()
+
+	for name in args.names:
+		if name not in roms:
+			parser.error('unknown workload %s' % name)
+
+	results = bench(args.count, {'cpu_jit': args.jit}, args.repeat, args.names)
+
+	for name, rec in results.items():
+		logging.info('%-8s %7.2f MIPS %8.1f ns/ins %6.3f blocks/ins %8d peak bytes',
+			name, rec['mips'], rec['ns_per_ins'], rec['blocks_per_ins'], rec['peak_bytes'])
+
+	if args.out:
+		with open(args.out, 'w') as f:
+			json.dump(results, f, indent=1, sort_keys=True)
+
+	if args.baseline:
+		with open(args.baseline) as f:
+			slower = compare(results, json.load(f), args.tolerance)
+		for name, ratio in sorted(slower.items()):
+			logging.info('%s: %.2fx slower than the baseline', name, ratio)
+		if slower:
+			sys.exit(1)
+
+if __name__ == '__main__':
+		main()
@@ -1,4 +1,3 @@
-import dialogs
 import pickle
 import pprint
 import json
@@ -25,6 +24,74 @@ class Config():
 					'value'  : 3,
 					'title'  : 'Download Timeout',
 				},
+				{
+					'key'    : 'rom_dl_jobs',
+					'type'   : 'number',
+					'value'  : 4,
+					'title'  : 'Parallel Downloads',
+				},
+				{
+					'key'    : 'rom_cache_dir',
+					'type'   : 'text',
+					'value'  : 'rom-cache',
+					'title'  : 'Cache Directory',
+				},
+				{
+					'key'    : 'rom_cache_sz',
+					'type'   : 'number',
+					'value'  : 1048576,
+					'title'  : 'Cache Size',
+				},
+				{
+					'key'    : 'rom_cache_age',
+					'type'   : 'number',
+					'value'  : 3600,
+					'title'  : 'Cache Max Age',
+				},
+			]),
+			('System', [
+				{
+					'key'    : 'sys_backend',
+					'type'   : 'text',
+					'value'  : 'pythonista',
+					'title'  : 'Backend',
+				},
+				{
+					'key'    : 'sys_rewind',
+					'type'   : 'number',
+					'value'  : 0,
+					'title'  : 'Rewind Seconds',
+				},
+				{
+					'key'    : 'sys_record',
+					'type'   : 'text',
+					'value'  : '',
+					'title'  : 'Record Input To',
+				},
+				{
+					'key'    : 'sys_export',
+					'type'   : 'text',
+					'value'  : '',
+					'title'  : 'Export Frames To',
+				},
+				{
+					'key'    : 'sys_export_fmt',
+					'type'   : 'text',
+					'value'  : 'gif',
+					'title'  : 'Export Format',
+				},
+				{
+					'key'    : 'sys_export_scale',
+					'type'   : 'number',
+					'value'  : 2,
+					'title'  : 'Export Scale',
+				},
+				{
+					'key'    : 'sys_export_queue',
+					'type'   : 'number',
+					'value'  : 256,
+					'title'  : 'Export Queue Frames',
+				},
 			]),
 			('RAM', [
 				{
@@ -36,10 +103,16 @@ class Config():
 			]),
 			('CPU', [
 				{
-					'key'    : 'cpu_delay',
+					'key'    : 'cpu_ips',
 					'type'   : 'number',
-					'value'  : 5000,
-					'title'  : 'Fetch Delay',
+					'value'  : 600,
+					'title'  : 'Instructions/sec',
+				},
+				{
+					'key'    : 'cpu_throttle',
+					'type'   : 'switch',
+					'value'  : True,
+					'title'  : 'Real-time Speed',
 				},
 				{
 					'key'    : 'cpu_delay_hz',
@@ -53,6 +126,30 @@ class Config():
 					'value'  : 60,
 					'title'  : 'Sound Timer Hz',
 				},
+				{
+					'key'    : 'cpu_deterministic',
+					'type'   : 'switch',
+					'value'  : False,
+					'title'  : 'Deterministic',
+				},
+				{
+					'key'    : 'cpu_seed',
+					'type'   : 'number',
+					'value'  : 0,
+					'title'  : 'Random Seed',
+				},
+				{
+					'key'    : 'cpu_idle_skip',
+					'type'   : 'switch',
+					'value'  : True,
+					'title'  : 'Skip Idle Loops',
+				},
+				{
+					'key'    : 'cpu_analyze',
+					'type'   : 'switch',
+					'value'  : True,
+					'title'  : 'Predecode ROM',
+				},
 				{
 					'key'    : 'cpu_entry',
 					'type'   : 'number',
@@ -77,13 +174,35 @@ class Config():
 					'value'  : False,
 					'title'  : 'Instruction Trace',
 				},
-			]),
-			('Keyboard', [
 				{
-					'key'    : 'kbd_delay',
-					'type'   : 'number',
-					'value'  : 200000,
-					'title'  : 'Fetch Delay',
+					'key'    : 'cpu_trace_file',
+					'type'   : 'text',
+					'value'  : 'trace.txt',
+					'title'  : 'Trace File',
+				},
+				{
+					'key'    : 'cpu_coverage',
+					'type'   : 'switch',
+					'value'  : False,
+					'title'  : 'Opcode Coverage',
+				},
+				{
+					'key'    : 'cpu_profile',
+					'type'   : 'switch',
+					'value'  : False,
+					'title'  : 'Profiler',
+				},
+				{
+					'key'    : 'cpu_profile_file',
+					'type'   : 'text',
+					'value'  : 'profile.json',
+					'title'  : 'Profile File',
+				},
+				{
+					'key'    : 'cpu_jit',
+					'type'   : 'switch',
+					'value'  : False,
+					'title'  : 'Block Compiler',
 				},
 			]),
 			('Graphics', [
@@ -149,6 +268,8 @@ class Config():
 		raise KeyError(key)
 		
 	def dialog(self):
+		import dialogs
+		
 		sections = [(k,[{
 			'key': d['key'],
 			'type': d['type'],
@@ -0,0 +1,29 @@
+class Backend:
+	# audio
+	def boot(self):
+		pass
+
+	def effect(self):
+		pass
+
+	def shutdown(self):
+		pass
+
+	# video and input
+	def show(self, gfx, kbd):
+		pass
+
+	# called by the cpu once per scheduler frame
+	def frame(self, cpu):
+		pass
+
+def load(name='pythonista', **kwargs):
+	# backends are imported lazily so that pythonista modules are only
+	# required when actually used
+	if name == 'headless':
+		from emul.headless import Headless
+		return Headless(**kwargs)
+	if name == 'pythonista':
+		from emul.pythonista import Pythonista
+		return Pythonista(**kwargs)
+	raise ValueError('unknown backend: %s' % name)
@@ -0,0 +1,80 @@
+import mmap
+import struct
+
+magic = b'C8PK'
+version = 1
+
+# magic, version, rom count
+header = struct.Struct('>4sHI')
+# data offset, size, name length; followed by the utf-8 name
+entry = struct.Struct('>IIH')
+
+# an index of named roms followed by their concatenated contents
+
+def pack(path, roms, limit=None):
+	# write (name, data) pairs as a corpus; roms larger than limit bytes
+	# are rejected
+	roms = [(name.encode('utf-8'), bytes(data)) for name, data in roms]
+	for name, data in roms:
+		if limit is not None and len(data) > limit:
+			raise ValueError('%s: %d bytes does not fit in %d'%(name.decode('utf-8'), len(data), limit))
+
+	off = header.size + sum(entry.size + len(name) for name, _ in roms)
+	index = bytearray(header.pack(magic, version, len(roms)))
+	for name, data in roms:
+		index += entry.pack(off, len(data), len(name)) + name
+		off += len(data)
+
+	with open(path, 'wb') as f:
+		f.write(index)
+		for _, data in roms:
+			f.write(data)
+
+class Corpus:
+	# read-only view of a corpus file; roms are memoryview slices of the
+	# mapping and are never copied until loaded into ram. they have to be
+	# released before the corpus is closed
+	def __init__(self, path):
+		with open(path, 'rb') as f:
+			self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		self.view = memoryview(self.map)
+
+		tag, ver, count = header.unpack_from(self.view)
+		if tag != magic or ver != version:
+			self.close()
+			raise ValueError('not a version %d corpus'%version)
+
+		# name -> (offset, size), in file order
+		self.index = {}
+		pos = header.size
+		for _ in range(count):
+			off, size, n = entry.unpack_from(self.view, pos)
+			pos += entry.size
+			name = bytes(self.view[pos:pos+n]).decode('utf-8')
+			pos += n
+			if off + size > len(self.map):
+				self.close()
+				raise ValueError('%s: data past the end of the corpus'%name)
+			self.index[name] = (off, size)
+
+	def __len__(self):
+		return len(self.index)
+
+	def __iter__(self):
+		return iter(self.index)
+
+	def __getitem__(self, name):
+		off, size = self.index[name]
+		return self.view[off:off+size]
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, type, val, tb):
+		self.close()
+
+	def close(self):
+		if self.view is not None:
+			self.view.release()
+			self.view = None
+			self.map.close()
@@ -0,0 +1,105 @@
+from array import array
+
+from emul.cpu import CPU, Fault
+
+# handlers with two outcomes, and how the outcome is read back after
+# the handler ran
+skips = {'op_skip_eq_val', 'op_skip_neq_val', 'op_skip_eq_reg', 'op_skip_neq_reg', 'kop_skp', 'kop_sknp'}
+flags = {'lop_add', 'lop_sub', 'lop_subn', 'lop_shr', 'lop_shl', 'op_sprite'}
+
+# names of the two outcomes
+outcomes = {
+	'skip': ('not_taken', 'taken'),
+	'flag': ('vf0', 'vf1'),
+}
+
+def handler_names():
+	# every handler the opcode tables can dispatch to
+	names = set()
+	for table in (CPU.op, CPU.rop, CPU.lop, CPU.kop, CPU.mop):
+		names.update(n for n in table.values() if n not in ('rop', 'lop', 'kop', 'mop'))
+	names.add('op_jump_idle')
+	return sorted(names)
+
+class Coverage:
+	# counts executed handlers, their outcomes and the distinct pcs run
+	# into counters allocated up front, and remembers where execution
+	# broke
+	def __init__(self, ram_sz=4096):
+		self.names = handler_names()
+		self.index = {n: i for i, n in enumerate(self.names)}
+		self.kind = [('skip' if n in skips else 'flag' if n in flags else None) for n in self.names]
+
+		self.counts = array('Q', bytes(8 * len(self.names)))
+		# two outcome counters per handler
+		self.branches = array('Q', bytes(16 * len(self.names)))
+		self.pcs = bytearray(ram_sz)
+
+		# (pc, opcode, error) of the instruction that stopped the run
+		self.fault = None
+
+	def hit(self, pc, handler, cpu):
+		k = self.index[handler.__name__]
+		self.counts[k] += 1
+		self.pcs[pc] = 1
+
+		kind = self.kind[k]
+		if kind == 'skip':
+			self.branches[k * 2 + (cpu.pc != pc + 2)] += 1
+		elif kind == 'flag':
+			self.branches[k * 2 + (cpu.V[15] & 1)] += 1
+
+	def error(self, pc, e, ram):
+		if isinstance(e, Fault):
+			self.fault = (e.pc, e.code, type(e).__name__)
+		else:
+			code = ram[pc] << 8 | ram[pc + 1] if pc + 1 < len(ram) else None
+			self.fault = (pc, code, '%s: %s'%(type(e).__name__, e))
+
+	def report(self):
+		handlers = {n: self.counts[i] for i, n in enumerate(self.names) if self.counts[i]}
+
+		branches = {}
+		for i, n in enumerate(self.names):
+			if self.kind[i] and self.counts[i]:
+				no, yes = outcomes[self.kind[i]]
+				branches[n] = {no: self.branches[i * 2], yes: self.branches[i * 2 + 1]}
+
+		fault = None
+		if self.fault:
+			pc, code, err = self.fault
+			fault = {'pc': '%04x'%pc, 'code': None if code is None else '%04x'%code, 'error': err}
+
+		return {
+			'instructions': sum(self.counts),
+			'handlers': handlers,
+			'branches': branches,
+			'pcs': sum(self.pcs),
+			'fault': fault,
+		}
+
+def columns():
+	# matrix columns: handler counts, then every outcome of the handlers
+	# that have two
+	cols = handler_names()
+	for n in handler_names():
+		kind = 'skip' if n in skips else 'flag' if n in flags else None
+		if kind:
+			cols += ['%s:%s'%(n, o) for o in outcomes[kind]]
+	return cols
+
+def matrix(reports):
+	# rows of [rom, fault, count per column] from (rom, report) pairs
+	cols = columns()
+	rows = []
+	for rom, rep in reports:
+		fault = rep['fault']
+		row = [rom, '%s at %s'%(fault['error'], fault['pc']) if fault else '']
+		for col in cols:
+			name, _, outcome = col.partition(':')
+			if outcome:
+				row.append(rep['branches'].get(name, {}).get(outcome, 0))
+			else:
+				row.append(rep['handlers'].get(name, 0))
+		rows.append(row)
+	return ['rom', 'fault'] + cols, rows
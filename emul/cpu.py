@@ -1,8 +1,11 @@
 import random
 import logging
+import time
 import urllib.request
-from struct import *
+from array import array
+from collections import namedtuple
 
+from emul.ram import bigfont_addr
 from emul.timer import Timer
 
 def dec4(opcode):
@@ -18,405 +21,618 @@ def decl(opcode):
 def deca(opcode):
 	return (opcode & 0x0fff)
 
+class Fault(Exception):
+	def __init__(self, pc, code):
+		super(Fault, self).__init__('%s at %04x (%04x)'%(type(self).__name__, pc, code))
+		self.pc = pc
+		self.code = code
+
+class UnknownOpcode(Fault):
+	pass
+
+class StackOverflow(Fault):
+	pass
+
+class StackUnderflow(Fault):
+	pass
+
+class PcOverflow(Fault):
+	# execution ran past the end of ram
+	pass
+
+class Idle(Exception):
+	# raised by a polling loop's jump to end the current batch
+	pass
+
+# predecoded instruction; handler is called with (x, y, n, kk, nnn)
+Ins = namedtuple('Ins', 'handler x y n kk nnn code')
+
 class CPU:
-	def __init__(self, cpu_stack_sz=24, cpu_delay=5000, cpu_delay_hz=60, cpu_sound_hz=60, cpu_trace=False, **kwargs):
+	__slots__ = (
+		'stack_sz', 'delay_hz', 'sound_hz', 'deterministic', 'ips', 'frame_hz', 'throttle',
+		'pc', 'sp', 'I', 'V', 'cycles', 'frames', 'frame_hooks',
+		'ram', 'stack', 'rpl', 'icache', 'vmem', 'rmem',
+		'idle_skip', 'idle_sz', 'idle', 'skipped',
+		'backend', 'gfx', 'kbd', 'rand', 'delay_timer', 'sound_timer', 'tracer', 'profiler', 'coverage', 'jit',
+	)
+
+	# opcode tables; entries name either a handler or a sub table
+	op = {
+		0x0: 'rop',
+		0x1: 'op_jump',
+		0x2: 'op_call',
+		0x3: 'op_skip_eq_val',
+		0x4: 'op_skip_neq_val',
+		0x5: 'op_skip_eq_reg',
+		0x6: 'op_move',
+		0x7: 'op_add',
+		0x8: 'lop',
+		0x9: 'op_skip_neq_reg',
+		0xa: 'op_load_index',
+		0xb: 'op_jump_index',
+		0xc: 'op_rand',
+		0xd: 'op_sprite',
+		0xe: 'kop',
+		0xf: 'mop',
+	}
+
+	rop = {
+		0x00: 'rop_nop',
+		0xc0: 'rop_down',
+		0xc1: 'rop_down',
+		0xc2: 'rop_down',
+		0xc3: 'rop_down',
+		0xc4: 'rop_down',
+		0xc5: 'rop_down',
+		0xc6: 'rop_down',
+		0xc7: 'rop_down',
+		0xc8: 'rop_down',
+		0xc9: 'rop_down',
+		0xca: 'rop_down',
+		0xcb: 'rop_down',
+		0xcc: 'rop_down',
+		0xcd: 'rop_down',
+		0xce: 'rop_down',
+		0xcf: 'rop_down',
+		0xe0: 'rop_clear',
+		0xee: 'rop_ret',
+		0xfb: 'rop_right',
+		0xfc: 'rop_left',
+		0xfd: 'rop_exit',
+		0xfe: 'rop_ext',
+		0xff: 'rop_norm',
+	}
+
+	lop = {
+		0x0: 'lop_move',
+		0x1: 'lop_or',
+		0x2: 'lop_and',
+		0x3: 'lop_xor',
+		0x4: 'lop_add',
+		0x5: 'lop_sub',
+		0x6: 'lop_shr',
+		0x7: 'lop_subn',
+		0xe: 'lop_shl',
+	}
+
+	kop = {
+		0x9e: 'kop_skp',
+		0xa1: 'kop_sknp',
+	}
+
+	mop = {
+		0x07: 'mop_load_delay',
+		0x0a: 'mop_keyd',
+		0x15: 'mop_store_delay',
+		0x18: 'mop_store_sound',
+		0x1e: 'mop_add_index',
+		0x29: 'mop_load_sp_index',
+		0x30: 'mop_load_exsp_index',
+		0x33: 'mop_store_bcd',
+		0x55: 'mop_store',
+		0x65: 'mop_load',
+		0x75: 'mop_srpl',
+		0x85: 'mop_lrpl',
+	}
+
+	def __init__(self, cpu_stack_sz=24, cpu_ips=600, cpu_frame_hz=60, cpu_throttle=True, cpu_delay_hz=60, cpu_sound_hz=60, cpu_deterministic=False, cpu_seed=0, cpu_idle_skip=True, cpu_idle_sz=8, cpu_trace=False, cpu_trace_file=None, cpu_trace_sz=4096, cpu_profile=False, cpu_profile_file=None, cpu_coverage=False, cpu_jit=False, **kwargs):
 		self.stack_sz = cpu_stack_sz
 		self.delay_hz = cpu_delay_hz
 		self.sound_hz = cpu_sound_hz
-		self.fetch_delay = cpu_delay
-		self.cpu_trace = cpu_trace
-		
+		self.deterministic = cpu_deterministic
+		self.ips = cpu_ips
+		self.frame_hz = cpu_frame_hz
+		self.throttle = cpu_throttle
+
 		# initialize registers
 		self.pc = 0
 		self.sp = 0
 		self.I = 0
-		self.V = [0 for _ in range(16)]
+		self.V = bytearray(16)
+
+		# executed instructions and scheduler frames
+		self.cycles = 0
+		self.frames = 0
+
+		# called with the cpu at the end of every frame
+		self.frame_hooks = []
 
 		# initialize memory structures
 		self.ram = kwargs['ram']
-		self.stack = [0 for _ in range(self.stack_sz)]
-		self.rpl = [0 for _ in range(16)]
+		self.stack = array('H', bytes(2 * self.stack_sz))
+		self.rpl = bytearray(16)
+
+		# views for bulk register loads and stores
+		self.vmem = memoryview(self.V)
+		self.rmem = memoryview(self.ram)
+
+		# predecoded instructions keyed by address
+		self.icache = [None for _ in range(len(self.ram))]
+		self.ram.watch(self.invalidate)
+
+		# polling loops; address of the backward jump -> loop start
+		self.idle_skip = cpu_idle_skip
+		self.idle_sz = cpu_idle_sz
+		self.idle = {}
+		self.skipped = 0
 
 		# external resources
-		self.audio = kwargs['audio']
+		self.backend = kwargs['backend']
 		self.gfx = kwargs['gfx']
 		self.kbd = kwargs['kbd']
-		
-		# initialize timers
-		self.delay_timer = Timer(freq=self.delay_hz)
-		self.sound_timer = Timer(freq=self.sound_hz, event=self.audio.effect)
-		
-		# debug
-		self.mnem = None
-
-		self.op = {
-			0x0: self.op_exe_cret,
-			0x1: self.op_jump,
-			0x2: self.op_call,
-			0x3: self.op_skip_eq_val,
-			0x4: self.op_skip_neq_val,
-			0x5: self.op_skip_eq_reg,
-			0x6: self.op_move,
-			0x7: self.op_add,
-			0x8: self.op_exe_logic,
-			0x9: self.op_skip_neq_reg,
-			0xa: self.op_load_index,
-			0xb: self.op_jump_index,
-			0xc: self.op_rand,
-			0xd: self.op_sprite,
-			0xe: self.op_exe_kbd,
-			0xf: self.op_exe_misc,
-		}
-
-		self.rop = {
-			0x00: self.rop_nop,
-			0xc0: self.rop_down,
-			0xc1: self.rop_down,
-			0xc2: self.rop_down,
-			0xc3: self.rop_down,
-			0xc4: self.rop_down,
-			0xc5: self.rop_down,
-			0xc6: self.rop_down,
-			0xc7: self.rop_down,
-			0xc8: self.rop_down,
-			0xc9: self.rop_down,
-			0xca: self.rop_down,
-			0xcb: self.rop_down,
-			0xcc: self.rop_down,
-			0xcd: self.rop_down,
-			0xce: self.rop_down,
-			0xcf: self.rop_down,
-			0xe0: self.rop_clear,
-			0xee: self.rop_ret,
-			0xfb: self.rop_right,
-			0xfc: self.rop_left,
-			0xfd: self.rop_nop,
-			0xfe: self.rop_ext,
-			0xff: self.rop_norm,
-		}
-
-		self.lop = {
-			0x0: self.lop_move,
-			0x1: self.lop_or,
-			0x2: self.lop_and,
-			0x3: self.lop_xor,
-			0x4: self.lop_add,
-			0x5: self.lop_sub,
-			0x6: self.lop_shr,
-			0x7: self.lop_subn,
-			0xe: self.lop_shl,
-		}
-		
-		self.kop = {
-			0x9e: self.kop_skp,
-			0xa1: self.kop_sknp,
-		}
-		
-		self.mop = {
-			0x07: self.mop_load_delay,
-			0x0a: self.mop_keyd,
-			0x15: self.mop_store_delay,
-			0x18: self.mop_store_sound,
-			0x1e: self.mop_add_index,
-			0x29: self.mop_load_sp_index,
-			0x30: self.mop_load_exsp_index,
-			0x33: self.mop_store_bcd,
-			0x55: self.mop_store,
-			0x65: self.mop_load,
-			0x75: self.mop_srpl,
-			0x85: self.mop_lrpl,
-		}
-
-	def run(self, pc):
+
+		# per-instance random number generator (xorshift32)
+		seed = cpu_seed if self.deterministic else random.getrandbits(32)
+		self.rand = (seed & 0xffffffff) or 0x2545f491
+
+		# initialize timers; deterministic runs count emulated time
+		clock = self.clock if self.deterministic else time.monotonic
+		self.delay_timer = Timer(freq=self.delay_hz, clock=clock)
+		self.sound_timer = Timer(freq=self.sound_hz, event=self.backend.effect, clock=clock)
+
+		# instruction trace; nothing is recorded or formatted when off
+		self.tracer = None
+		if cpu_trace:
+			from emul.trace import Tracer
+			self.tracer = Tracer(cpu_trace_file, cpu_trace_sz)
+
+		# per handler, pc and block counters; off costs nothing either
+		self.profiler = None
+		if cpu_profile:
+			from emul.profile import Profiler
+			self.profiler = Profiler(cpu_profile_file)
+			self.frame_hooks.append(self.profiler.frame)
+
+		# executed handlers, outcomes and the pc of a fault
+		self.coverage = None
+		if cpu_coverage:
+			from emul.coverage import Coverage
+			self.coverage = Coverage(len(self.ram))
+
+		# block compiler; traces, profiles and coverage need the
+		# per-instruction interpreter
+		self.jit = None
+		if cpu_jit and not self.tracer and not self.profiler and not self.coverage:
+			from emul.jit import JIT
+			self.jit = JIT(self, **kwargs)
+
+	def run(self, pc, cycles=None):
 		self.pc = pc
-		while self.power_on():
-			pc, code = self.fetch()
-			self.step()
-			self.exe(code)
-			self.trace(pc, code)
-	
+		end = None if cycles is None else self.cycles + cycles
+
+		# run a batch of instructions per frame and sleep off the rest
+		ips = self.ips
+		hz = self.frame_hz
+		intvl = 1.0 / self.frame_hz
+		deadline = time.monotonic()
+
+		try:
+			while self.power_on():
+				# the remainder of ips / hz carries over, so that a second
+				# runs exactly ips instructions
+				f = self.frames
+				count = (f + 1) * ips // hz - f * ips // hz
+				if end is not None:
+					if self.cycles >= end:
+						break
+					count = min(count, end - self.cycles)
+
+				if count:
+					self.steps(count)
+				self.frame()
+
+				if not self.throttle:
+					continue
+
+				deadline += intvl
+				delay = deadline - time.monotonic()
+				if delay > 0:
+					time.sleep(delay)
+				else:
+					# fell behind (e.g. waiting for a key); don't try to catch up
+					deadline = time.monotonic()
+		finally:
+			if self.tracer:
+				self.tracer.flush()
+			if self.profiler:
+				self.profiler.save()
+
+	def clock(self):
+		# emulated seconds
+		return self.cycles / self.ips
+
+	def frame(self):
+		self.frames += 1
+		for hook in self.frame_hooks:
+			hook(self)
+		self.sound_timer.poll()
+
+	def steps(self, count):
+		# instructions run so far; cycles is updated once at the end so
+		# that the deterministic clock stays at the start of the batch
+		done = 0
+		if self.jit:
+			try:
+				while done < count:
+					pc = self.pc
+					n = self.jit.exe(count - done)
+					if not n:
+						break
+					done += n
+			except Idle:
+				# fast-forward over the rest of the batch
+				self.skipped += count - done
+				self.cycles += count
+				return
+			except Fault as e:
+				# blocks are straight-line code, so the instructions run
+				# before the faulting one follow from its address
+				self.cycles += done + (e.pc - pc) // 2
+				raise
+			if done == count:
+				self.cycles += count
+				return
+			# the next block is longer than what is left of the batch;
+			# interpret the rest
+
+		i = done
+		try:
+			if self.tracer:
+				record = self.tracer.record
+				for i in range(done, count):
+					pc = self.pc
+					handler, x, y, n, kk, nnn, code = self.fetch()
+					record(pc, code, self.I, self.V)
+					self.pc = pc + 2
+					handler(x, y, n, kk, nnn)
+			elif self.profiler:
+				record = self.profiler.record
+				now = time.perf_counter_ns
+				for i in range(done, count):
+					pc = self.pc
+					handler, x, y, n, kk, nnn, code = self.fetch()
+					self.pc = pc + 2
+					t = now()
+					try:
+						handler(x, y, n, kk, nnn)
+					finally:
+						record(pc, code, handler.__name__, now() - t)
+			elif self.coverage:
+				hit = self.coverage.hit
+				for i in range(done, count):
+					pc = self.pc
+					try:
+						handler, x, y, n, kk, nnn, code = self.fetch()
+						self.pc = pc + 2
+						handler(x, y, n, kk, nnn)
+					except Idle:
+						hit(pc, handler, self)
+						raise
+					except Exception as e:
+						self.coverage.error(pc, e, self.ram)
+						raise
+					hit(pc, handler, self)
+			else:
+				for i in range(done, count):
+					pc = self.pc
+					handler, x, y, n, kk, nnn, code = self.fetch()
+					self.pc = pc + 2
+					handler(x, y, n, kk, nnn)
+		except Idle:
+			# fast-forward over the rest of the batch
+			self.skipped += count - i - 1
+		except Fault:
+			# the faulting instruction does not count
+			self.cycles += i
+			raise
+		self.cycles += count
+
 	def power_on(self):
-		off = self.kbd.pressed('shutdown')
-		
-		# make sure to stop timer threads
-		if off:
-			del self.delay_timer
-			del self.sound_timer
-		
-		return not off
+		return not self.kbd.pressed('shutdown')
 
 	def fetch(self):
-		# emulate slow cpu
-		for _ in range(self.fetch_delay):
-				continue
-		
-		return (self.pc, unpack('>H', self.ram[self.pc:self.pc+2])[0])
-		
+		try:
+			ins = self.icache[self.pc]
+			if ins is None:
+				ins = self.icache[self.pc] = self.decode(
+					self.ram[self.pc] << 8 | self.ram[self.pc + 1], self.pc)
+		except IndexError:
+			raise PcOverflow(self.pc, 0) from None
+		return ins
+
+	@classmethod
+	def lookup(cls, code):
+		# handler name for an opcode; KeyError if unknown
+		name = cls.op[dec4(code)]
+		if name == 'lop':
+			name = cls.lop[dec1(code)]
+		elif name in ('rop', 'kop', 'mop'):
+			name = getattr(cls, name)[decl(code)]
+		return name
+
+	def decode(self, code, pc=None):
+		try:
+			name = self.lookup(code)
+		except KeyError:
+			raise UnknownOpcode(self.pc if pc is None else pc, code)
+
+		if name == 'op_jump' and pc != None and self.idle_skip and self.polling(pc, deca(code)):
+			name = 'op_jump_idle'
+			self.idle[pc] = deca(code)
+
+		return Ins(getattr(self, name),
+			dec3(code), dec2(code), dec1(code), decl(code), deca(code), code)
+
+	# handlers allowed in a polling loop; none of them write memory and
+	# the registers they set only depend on constants, DT and the keypad
+	polls = {
+		'rop_nop',
+		'op_jump',
+		'op_skip_eq_val',
+		'op_skip_neq_val',
+		'op_skip_eq_reg',
+		'op_skip_neq_reg',
+		'op_move',
+		'kop_skp',
+		'kop_sknp',
+		'mop_load_delay',
+	}
+
+	def polling(self, pc, target):
+		# is the jump at pc closing a loop that only polls DT or keys?
+		if not 0 <= pc - target <= self.idle_sz * 2:
+			return False
+
+		for addr in range(target, pc, 2):
+			code = self.ram[addr] << 8 | self.ram[addr + 1]
+			try:
+				name = self.lookup(code)
+			except KeyError:
+				return False
+			if name not in self.polls:
+				return False
+			# jumps have to stay inside the loop
+			if name == 'op_jump' and not target <= deca(code) <= pc:
+				return False
+		return True
+
+	def invalidate(self, start, stop):
+		# an instruction starting one byte earlier overlaps the write
+		start = max(start - 1, 0)
+		self.icache[start:stop] = [None] * (stop - start)
+
+		# a write into a polling loop invalidates its jump as well
+		for pc, target in list(self.idle.items()):
+			if target < stop and start < pc + 2:
+				del self.idle[pc]
+				self.icache[pc] = None
+				if self.jit:
+					self.jit.invalidate(pc, pc + 2)
+
 	def step(self):
 		self.pc += 2
 
 	def exe(self, code):
-		self.op[dec4(code)](code)
+		handler, x, y, n, kk, nnn, _ = self.decode(code)
+		handler(x, y, n, kk, nnn)
 
-	def op_exe_cret(self, code):
-		self.rop[decl(code)](code)
-
-	def op_exe_logic(self, code):
-		self.lop[dec1(code)](code)
-	
-	def op_exe_kbd(self, code):
-		self.kop[decl(code)](code)
-	
-	def op_exe_misc(self, code):
-		self.mop[decl(code)](code)
-
-	def rop_nop(self, code):
+	def rop_nop(self, x, y, n, kk, nnn):
 		pass
 
-	def rop_down(self, code):
-		self.gfx.down(dec1(code))
+	def rop_down(self, x, y, n, kk, nnn):
+		self.gfx.down(n)
 
-	def rop_clear(self, code):
-		self.log('CLS')
+	def rop_clear(self, x, y, n, kk, nnn):
 		self.gfx.clear()
 
-	def rop_ret(self, code):
-		self.log('RET')
+	def rop_ret(self, x, y, n, kk, nnn):
+		if self.sp <= 0:
+			raise StackUnderflow(self.pc - 2, 0x00ee)
 		self.sp -= 1
 		self.pc = self.stack[self.sp]
 
-	def rop_right():
+	def rop_right(self, x, y, n, kk, nnn):
 		self.gfx.right()
 
-	def rop_left():
+	def rop_left(self, x, y, n, kk, nnn):
 		self.gfx.left()
 
-	def rop_ext():
+	def rop_exit(self, x, y, n, kk, nnn):
+		# stay on the exit and power off at the end of the batch
+		self.pc -= 2
+		self.kbd.press('shutdown')
+
+	def rop_ext(self, x, y, n, kk, nnn):
 		self.gfx.extend(True)
 
-	def rop_norm():
+	def rop_norm(self, x, y, n, kk, nnn):
 		self.gfx.extend(False)
 
-	def op_jump(self, code):
-		self.log('JP %04x'%deca(code))
-		self.pc = deca(code)
+	def op_jump(self, x, y, n, kk, nnn):
+		self.pc = nnn
 
-	def op_call(self, code):
-		self.log('CALL %04x'%deca(code))
+	def op_jump_idle(self, x, y, n, kk, nnn):
+		# nothing can change before the next timer tick or input event
+		self.pc = nnn
+		raise Idle()
+
+	def op_call(self, x, y, n, kk, nnn):
+		if self.sp >= self.stack_sz:
+			raise StackOverflow(self.pc - 2, 0x2000 | nnn)
 		self.stack[self.sp] = self.pc
 		self.sp += 1
-		self.pc = deca(code)
+		self.pc = nnn
 
-	def op_skip_eq_val(self, code):
-		self.log('SE V%d, %04x'%(dec3(code), decl(code)))
-		if self.V[dec3(code)] == decl(code):
+	def op_skip_eq_val(self, x, y, n, kk, nnn):
+		if self.V[x] == kk:
 			self.step()
 
-	def op_skip_neq_val(self, code):
-		self.log('SNE V%d, %04x'%(dec3(code), decl(code)))
-		if self.V[dec3(code)] != decl(code):
+	def op_skip_neq_val(self, x, y, n, kk, nnn):
+		if self.V[x] != kk:
 			self.step()
 
-	def op_skip_eq_reg(self, code):
-		if self.V[dec3(code)] == self.V[dec2(code)]:
+	def op_skip_eq_reg(self, x, y, n, kk, nnn):
+		if self.V[x] == self.V[y]:
 			self.step()
 
-	def op_skip_neq_reg(self, code):
-		if self.V[dec3(code)] != self.V[dec2(code)]:
+	def op_skip_neq_reg(self, x, y, n, kk, nnn):
+		if self.V[x] != self.V[y]:
 			self.step()
 
-	def op_move(self, code):
-		self.log('LD V%d, %04x'%(dec3(code), decl(code)))
-		self.V[dec3(code)] = decl(code)
-
-	def op_add(self, code):
-		self.log('ADD V%d, %04x'%(dec3(code), decl(code)))
-		sum = self.V[dec3(code)] + decl(code)
-		self.V[dec3(code)] = sum & 0xff
-
-	def op_load_index(self, code):
-		self.log('LD I, %04x'%deca(code))
-		self.I = deca(code)
-
-	def op_jump_index(self, code):
-		self.log('JP V0, %04x'%deca(code))
-		self.pc = self.V[0] + deca(code)
-
-	def op_rand(self, code):
-		self.log('RND V%d, %04x'%(dec3(code), decl(code)))
-		self.V[dec3(code)] = decl(code) & random.randint(0x00, 0xff)
-
-	def op_sprite(self, code):
-		self.log('DRW V%d, V%d, %04x'%(dec3(code), dec2(code), dec1(code)))
-		x = self.V[dec3(code)]
-		y = self.V[dec2(code)]
-		size = dec1(code)
-		if self.gfx.extended and size == 0:
-			self.draw_ex(x, y, 16)
+	def op_move(self, x, y, n, kk, nnn):
+		self.V[x] = kk
+
+	def op_add(self, x, y, n, kk, nnn):
+		self.V[x] = (self.V[x] + kk) & 0xff
+
+	def op_load_index(self, x, y, n, kk, nnn):
+		self.I = nnn
+
+	def op_jump_index(self, x, y, n, kk, nnn):
+		self.pc = (self.V[0] + nnn) & 0xfff
+
+	def op_rand(self, x, y, n, kk, nnn):
+		r = self.rand
+		r ^= (r << 13) & 0xffffffff
+		r ^= r >> 17
+		r ^= (r << 5) & 0xffffffff
+		self.rand = r
+		self.V[x] = kk & r
+
+	def op_sprite(self, x, y, n, kk, nnn):
+		if self.gfx.extended and n == 0:
+			self.draw_ex(self.V[x], self.V[y], 16)
 		else:
-			self.draw(x, y, size)
+			self.draw(self.V[x], self.V[y], n)
 
 	def draw(self, x, y, size):
-		self.cf(0)
-		
-		for yi in range(size):
-			xb = bin(self.ram[self.I + yi])[2:].zfill(8)
+		rows = self.ram[self.I:self.I+size]
+		self.cf(1 if self.gfx.blit(x, y, rows, 8) else 0)
 
-			yc = (y + yi) % self.gfx.height
+	def draw_ex(self, x, y, size):
+		ram = self.ram
+		I = self.I
+		rows = [ram[I+i*2] << 8 | ram[I+i*2+1] for i in range(size)]
+		self.cf(1 if self.gfx.blit(x, y, rows, 16) else 0)
 
-			for xi in range(8):
-				xc = (x + xi) % self.gfx.width
+	def lop_move(self, x, y, n, kk, nnn):
+		self.V[x] = self.V[y]
 
-				p = (int(xb[xi]) == 1)
-				q = self.gfx.get(xc, yc)
+	def lop_or(self, x, y, n, kk, nnn):
+		self.V[x] |= self.V[y]
 
-				if p == q == True:
-					self.cf(1)
+	def lop_and(self, x, y, n, kk, nnn):
+		self.V[x] &= self.V[y]
 
-				self.gfx.set(xc, yc, p ^ q)
-		
-	def draw_ex(self, x, y, size):
-		self.cf(0)
-		
-		for yi in range(size):
-			for xii in range(2):
-				xb = bin(self.ram[self.I + (yi * 2) + xii])[2:].zfill(8)
-				
-				yc = (y + yi) % self.gfx.height
-
-				for xi in range(8):
-					xc = (x + xi + (xii * 8)) % self.gfx.width
-					
-					p = (int(xb[xi]) == 1)
-					q = self.gfx.get(xc, yc)
-
-					if p == q == True:
-						self.cf(1)
-
-					self.gfx.set(xc, yc, p ^ q)
-
-	def lop_move(self, code):
-		self.log('LD V%d, V%d'%(dec3(code), dec2(code)))
-		self.V[dec3(code)] = self.V[dec2(code)]
-
-	def lop_or(self, code):
-		self.log('OR V%d, V%d'%(dec3(code), dec2(code)))
-		self.V[dec3(code)] |= self.V[dec2(code)]
-
-	def lop_and(self, code):
-		self.log('AND V%d, V%d'%(dec3(code), dec2(code)))
-		self.V[dec3(code)] &= self.V[dec2(code)]
-
-	def lop_xor(self, code):
-		self.log('XOR V%d, V%d'%(dec3(code), dec2(code)))
-		self.V[dec3(code)] ^= self.V[dec2(code)]
-
-	def lop_add(self, code):
-		self.log('ADD V%d, V%d'%(dec3(code), dec2(code)))
-		sum = self.V[dec3(code)] + self.V[dec2(code)]
+	def lop_xor(self, x, y, n, kk, nnn):
+		self.V[x] ^= self.V[y]
+
+	def lop_add(self, x, y, n, kk, nnn):
+		sum = self.V[x] + self.V[y]
 		self.cf(1 if sum > 0xff else 0) # set 1 on carray
-		self.V[dec3(code)] = sum & 0xff
+		self.V[x] = sum & 0xff
 
-	def lop_sub(self, code):
-		self.log('SUB V%d, V%d'%(dec3(code), dec2(code)))
-		sub = self.V[dec3(code)] - self.V[dec2(code)]
+	def lop_sub(self, x, y, n, kk, nnn):
+		sub = self.V[x] - self.V[y]
 		self.cf(0 if sub < 0 else 1) # set 0 on borrow
-		self.V[dec3(code)] = sub & 0xff
+		self.V[x] = sub & 0xff
 
-	def lop_subn(self, code):
-		sub = self.V[dec2(code)] - self.V[dec3(code)]
+	def lop_subn(self, x, y, n, kk, nnn):
+		sub = self.V[y] - self.V[x]
 		self.cf(0 if sub < 0 else 1) # set 0 on borrow
-		self.V[dec3(code)] = sub & 0xff
-
-	def lop_shr(self, code):
-		self.log('SHR V%d'%dec3(code))
-		self.cf(self.V[dec3(code)] & 0x1)
-		self.V[dec3(code)] >>= 1
-		self.V[dec3(code)] &= 0xff
-
-	def lop_shl(self, code):
-		self.log('SHL V%d'%dec3(code))
-		self.cf((self.V[dec3(code)] & 0x80) >> 7)
-		self.V[dec3(code)] <<= 1
-		self.V[dec3(code)] &= 0xff
-		
-	def kop_skp(self, code):
-		self.log('SKP V%d'%dec3(code))
-		if self.kbd.peek(self.V[dec3(code)]):
+		self.V[x] = sub & 0xff
+
+	def lop_shr(self, x, y, n, kk, nnn):
+		self.cf(self.V[x] & 0x1)
+		self.V[x] >>= 1
+
+	def lop_shl(self, x, y, n, kk, nnn):
+		self.cf((self.V[x] & 0x80) >> 7)
+		self.V[x] = (self.V[x] << 1) & 0xff
+
+	def kop_skp(self, x, y, n, kk, nnn):
+		if self.kbd.keys >> (self.V[x] & 0xf) & 1:
 			self.step()
-		
-	def kop_sknp(self, code):
-		self.log('SKNP V%d'%dec3(code))
-		if not self.kbd.peek(self.V[dec3(code)]):
+
+	def kop_sknp(self, x, y, n, kk, nnn):
+		if not self.kbd.keys >> (self.V[x] & 0xf) & 1:
 			self.step()
 
-	def mop_load_delay(self, code):
-		self.log('LD V%d, DT'%dec3(code))
-		self.V[dec3(code)] = self.delay_timer.get()
+	def mop_load_delay(self, x, y, n, kk, nnn):
+		self.V[x] = self.delay_timer.get()
 
-	def mop_keyd(self, code):
-		self.log('LD V%d, K'%dec3(code))
-		self.V[dec3(code)] = self.kbd.wait()
+	def mop_keyd(self, x, y, n, kk, nnn):
+		key = self.kbd.wait()
+		if not self.kbd.on:
+			# powered off while waiting; stay on the wait
+			self.pc -= 2
+			return
+		self.V[x] = key
 
-	def mop_store_delay(self, code):
-		self.log('LD DT, V%d'%dec3(code))
-		self.delay_timer.set(self.V[dec3(code)])
+	def mop_store_delay(self, x, y, n, kk, nnn):
+		self.delay_timer.set(self.V[x])
 
-	def mop_store_sound(self, code):
-		self.log('LD ST, V%d'%dec3(code))
-		self.sound_timer.set(self.V[dec3(code)])
+	def mop_store_sound(self, x, y, n, kk, nnn):
+		self.sound_timer.set(self.V[x])
 
-	def mop_add_index(self, code):
-		self.log('ADD I, V%d'%dec3(code))
-		self.I += self.V[dec3(code)]
+	def mop_add_index(self, x, y, n, kk, nnn):
+		self.I = (self.I + self.V[x]) & 0xfff
 
-	def mop_load_sp_index(self, code):
-		self.I = self.V[dec3(code)] * 5
+	def mop_load_sp_index(self, x, y, n, kk, nnn):
+		self.I = self.V[x] * 5
 
-	def mop_load_exsp_index(self, code):
-		self.I = self.V[dec3(code)] * 10 
+	def mop_load_exsp_index(self, x, y, n, kk, nnn):
+		self.I = bigfont_addr + self.V[x] * 10
 
-	def mop_store_bcd(self, code):
-		self.log('LD B, V%d'%dec3(code))
-		bcd = self.V[dec3(code)]
-		self.ram[self.I:self.I+3] = [
-			int(bcd / 100) % 10, 
-			int(bcd / 10) % 10, 
-			bcd % 10
-		]
+	def mop_store_bcd(self, x, y, n, kk, nnn):
+		bcd = self.V[x]
+		# digits past the end of ram are dropped
+		size = max(min(3, len(self.ram) - self.I), 0)
+		self.ram[self.I:self.I+size] = bytes((bcd // 100, bcd // 10 % 10, bcd % 10))[:size]
 
-	def mop_store(self, code):
-		self.log('LD [I], V%d'%dec3(code))
-		size = dec3(code) + 1
-		self.ram[self.I:self.I+size] = self.V[0:size]
+	def mop_store(self, x, y, n, kk, nnn):
+		# registers past the end of ram are dropped
+		size = max(min(x + 1, len(self.ram) - self.I), 0)
+		self.ram[self.I:self.I+size] = self.vmem[0:size]
 
-	def mop_load(self, code):
-		self.log('LD V%d, [I]'%dec3(code))
-		size = dec3(code) + 1
-		self.V[0:size] = self.ram[self.I:self.I+size]
+	def mop_load(self, x, y, n, kk, nnn):
+		size = max(min(x + 1, len(self.ram) - self.I), 0)
+		self.vmem[0:size] = self.rmem[self.I:self.I+size]
 
-	def mop_srpl(self, opcode):
-		size = dec3(code)
-		self.rpl[0:size] = self.V
+	def mop_srpl(self, x, y, n, kk, nnn):
+		size = x + 1
+		self.rpl[0:size] = self.V[0:size]
 
-	def mop_lrpl(self, opcode):
-		size = dec3(code)
-		self.V[0:size] = self.rpl
+	def mop_lrpl(self, x, y, n, kk, nnn):
+		size = x + 1
+		self.V[0:size] = self.rpl[0:size]
 
 	def cf(self, value):
 		self.V[0x0f] = value
-		
+
 	def dump(self, pc, code):
 		val = 'PC  [%04x] OP  [%04x] I   [%04x]\n'%(pc, code, self.I)
 		for i in range(0x10):
 			val += 'V%02d [%04x] '%(i, self.V[i])
 			val += '\n' if i == 7 else ''
 		return val
-		
-	def trace(self, pc, code):
-		if self.cpu_trace:
-			print('%04x    %04x: %s'%(pc, code, self.mnem if self.mnem != None else '???'))
-		self.mnem = None
-	
-	def log(self, mnem):
-		self.mnem = mnem
@@ -0,0 +1,304 @@
+import hashlib
+import json
+from collections import namedtuple
+
+from emul.cpu import CPU, dec1, dec2, dec3, decl, deca
+
+# mnemonic formats keyed by handler name
+mnem = {
+	'rop_nop'            : 'NOP',
+	'rop_down'           : 'SCD %(n)d',
+	'rop_clear'          : 'CLS',
+	'rop_ret'            : 'RET',
+	'rop_right'          : 'SCR',
+	'rop_left'           : 'SCL',
+	'rop_exit'           : 'EXIT',
+	'rop_ext'            : 'HIGH',
+	'rop_norm'           : 'LOW',
+	'op_jump'            : 'JP %(nnn)04x',
+	'op_call'            : 'CALL %(nnn)04x',
+	'op_skip_eq_val'     : 'SE V%(x)d, %(kk)04x',
+	'op_skip_neq_val'    : 'SNE V%(x)d, %(kk)04x',
+	'op_skip_eq_reg'     : 'SE V%(x)d, V%(y)d',
+	'op_skip_neq_reg'    : 'SNE V%(x)d, V%(y)d',
+	'op_move'            : 'LD V%(x)d, %(kk)04x',
+	'op_add'             : 'ADD V%(x)d, %(kk)04x',
+	'op_load_index'      : 'LD I, %(nnn)04x',
+	'op_jump_index'      : 'JP V0, %(nnn)04x',
+	'op_rand'            : 'RND V%(x)d, %(kk)04x',
+	'op_sprite'          : 'DRW V%(x)d, V%(y)d, %(n)04x',
+	'lop_move'           : 'LD V%(x)d, V%(y)d',
+	'lop_or'             : 'OR V%(x)d, V%(y)d',
+	'lop_and'            : 'AND V%(x)d, V%(y)d',
+	'lop_xor'            : 'XOR V%(x)d, V%(y)d',
+	'lop_add'            : 'ADD V%(x)d, V%(y)d',
+	'lop_sub'            : 'SUB V%(x)d, V%(y)d',
+	'lop_shr'            : 'SHR V%(x)d',
+	'lop_subn'           : 'SUBN V%(x)d, V%(y)d',
+	'lop_shl'            : 'SHL V%(x)d',
+	'kop_skp'            : 'SKP V%(x)d',
+	'kop_sknp'           : 'SKNP V%(x)d',
+	'mop_load_delay'     : 'LD V%(x)d, DT',
+	'mop_keyd'           : 'LD V%(x)d, K',
+	'mop_store_delay'    : 'LD DT, V%(x)d',
+	'mop_store_sound'    : 'LD ST, V%(x)d',
+	'mop_add_index'      : 'ADD I, V%(x)d',
+	'mop_load_sp_index'  : 'LD F, V%(x)d',
+	'mop_load_exsp_index': 'LD HF, V%(x)d',
+	'mop_store_bcd'      : 'LD B, V%(x)d',
+	'mop_store'          : 'LD [I], V%(x)d',
+	'mop_load'           : 'LD V%(x)d, [I]',
+	'mop_srpl'           : 'LD R, V%(x)d',
+	'mop_lrpl'           : 'LD V%(x)d, R',
+}
+
+def disasm(code):
+	try:
+		name = CPU.lookup(code)
+	except KeyError:
+		return '???'
+
+	return mnem[name]%{
+		'x'  : dec3(code),
+		'y'  : dec2(code),
+		'n'  : dec1(code),
+		'kk' : decl(code),
+		'nnn': deca(code),
+	}
+
+# handlers that never fall through, and the conditional skips
+stops = {'op_jump', 'op_jump_index', 'rop_ret', 'rop_exit'}
+skips = {'op_skip_eq_val', 'op_skip_neq_val', 'op_skip_eq_reg', 'op_skip_neq_reg', 'kop_skp', 'kop_sknp'}
+
+# start and end address, successor blocks and called routines
+Block = namedtuple('Block', 'start end succs calls')
+
+class Analysis:
+	# static recursive-descent analysis of a rom loaded at base. only code
+	# reachable from entry through jumps, calls and skips is decoded, so
+	# data in between is never mistaken for instructions. targets of
+	# BNNN jumps are unknown and listed in indirect
+	def __init__(self, rom, base=0x200, entry=0x200):
+		self.rom = bytes(rom)
+		self.base = base
+		self.entry = entry
+		self.hash = hashlib.sha1(self.rom).hexdigest()
+
+		# address -> opcode of every reachable instruction
+		self.code = {}
+		# block start -> Block
+		self.blocks = {}
+		# routine entry -> sorted called routines
+		self.routines = {}
+		self.indirect = []
+		self.invalid = []
+
+		leaders = self.trace()
+		self.split(leaders)
+		self.graph()
+
+	def fetch(self, addr):
+		# (opcode, handler name) at addr; None outside the rom, a None name
+		# for unknown opcodes
+		off = addr - self.base
+		if not 0 <= off < len(self.rom) - 1:
+			return None
+		code = self.rom[off] << 8 | self.rom[off + 1]
+		try:
+			return code, CPU.lookup(code)
+		except KeyError:
+			return code, None
+
+	def flow(self, addr, code, name):
+		# successors within the routine, called routine and fall-through
+		nxt = addr + 2
+		if name == 'op_jump':
+			return [deca(code)], None, False
+		if name == 'op_call':
+			return [nxt], deca(code), False
+		if name in skips:
+			return [nxt, nxt + 2], None, False
+		if name in stops:
+			return [], None, False
+		return [nxt], None, True
+
+	def trace(self):
+		leaders = {self.entry}
+		self.routines[self.entry] = []
+		work = [self.entry]
+
+		while work:
+			addr = work.pop()
+			while addr not in self.code:
+				ins = self.fetch(addr)
+				if ins is None:
+					break
+				code, name = ins
+				if name is None:
+					self.invalid.append(addr)
+					break
+				self.code[addr] = code
+
+				succs, call, falls = self.flow(addr, code, name)
+				if name == 'op_jump_index':
+					self.indirect.append(addr)
+				if call is not None:
+					self.routines.setdefault(call, [])
+					leaders.add(call)
+					work.append(call)
+				if not falls:
+					leaders.update(succs)
+					work.extend(succs)
+					break
+				addr = succs[0]
+
+		self.invalid.sort()
+		self.indirect.sort()
+		return leaders
+
+	def split(self, leaders):
+		# basic blocks end at any control transfer or before a leader
+		for start in sorted(a for a in leaders if a in self.code):
+			addr = start
+			while True:
+				code = self.code[addr]
+				succs, call, falls = self.flow(addr, code, CPU.lookup(code))
+				nxt = addr + 2
+				if not falls or nxt not in self.code or nxt in leaders:
+					break
+				addr = nxt
+
+			self.blocks[start] = Block(start, addr + 2,
+				[s for s in succs if s in self.code], [call] if call is not None else [])
+
+	def graph(self):
+		# each routine owns the blocks reachable from its entry without
+		# following calls
+		self.owner = {}
+		for entry in sorted(self.routines):
+			seen = set()
+			work = [entry] if entry in self.blocks else []
+			callees = set()
+			while work:
+				start = work.pop()
+				if start in seen:
+					continue
+				seen.add(start)
+				self.owner.setdefault(start, entry)
+				blk = self.blocks[start]
+				callees.update(blk.calls)
+				work.extend(blk.succs)
+			self.routines[entry] = sorted(callees)
+
+	def regions(self):
+		# contiguous (start, end, 'code' or 'data') runs covering the rom
+		out = []
+		for off in range(len(self.rom)):
+			addr = self.base + off
+			kind = 'code' if addr in self.code or addr - 1 in self.code else 'data'
+			if out and out[-1][2] == kind:
+				out[-1][1] = addr + 1
+			else:
+				out.append([addr, addr + 1, kind])
+		return [tuple(r) for r in out]
+
+	def text(self):
+		lines = []
+		for start, end, kind in self.regions():
+			addr = start
+			while addr < end:
+				if kind == 'data':
+					chunk = self.rom[addr - self.base:min(end, addr + 8) - self.base]
+					lines.append('%04x    DB %s' % (addr, ', '.join('%02x' % b for b in chunk)))
+					addr += len(chunk)
+					continue
+				if addr in self.routines:
+					lines.append('sub_%04x:' % addr)
+				elif addr in self.blocks:
+					lines.append('L%04x:' % addr)
+				code = self.code[addr]
+				lines.append('%04x    %04x: %s' % (addr, code, disasm(code)))
+				addr += 2
+		return '\n'.join(lines) + '\n'
+
+	def as_dict(self):
+		return {
+			'hash'    : self.hash,
+			'base'    : self.base,
+			'entry'   : self.entry,
+			'blocks'  : [{
+				'start': '%04x' % b.start,
+				'end'  : '%04x' % b.end,
+				'succs': ['%04x' % s for s in b.succs],
+				'calls': ['%04x' % c for c in b.calls],
+			} for b in sorted(self.blocks.values())],
+			'routines': {'%04x' % r: ['%04x' % c for c in cs] for r, cs in sorted(self.routines.items())},
+			'regions' : [['%04x' % s, '%04x' % e, k] for s, e, k in self.regions()],
+			'indirect': ['%04x' % a for a in self.indirect],
+			'invalid' : ['%04x' % a for a in self.invalid],
+		}
+
+	def json(self):
+		return json.dumps(self.as_dict(), indent=1)
+
+	def dot(self):
+		# blocks grouped per routine; calls are dashed
+		lines = ['digraph rom {', '\tnode [shape=box fontname=Courier];']
+		for entry in sorted(self.routines):
+			lines.append('\tsubgraph cluster_%04x {' % entry)
+			lines.append('\t\tlabel="sub_%04x";' % entry)
+			for start in sorted(s for s, o in self.owner.items() if o == entry):
+				blk = self.blocks[start]
+				body = '\\l'.join(disasm(self.code[a]) for a in range(blk.start, blk.end, 2))
+				lines.append('\t\tb%04x [label="%04x:\\l%s\\l"];' % (start, start, body))
+			lines.append('\t}')
+		for blk in sorted(self.blocks.values()):
+			for s in blk.succs:
+				lines.append('\tb%04x -> b%04x;' % (blk.start, s))
+			for c in blk.calls:
+				if c in self.blocks:
+					lines.append('\tb%04x -> b%04x [style=dashed];' % (blk.start, c))
+		lines.append('}')
+		return '\n'.join(lines) + '\n'
+
+	def seed(self, cpu):
+		# predecode every reachable instruction, which also registers idle
+		# loops, and compile every block when the jit is on
+		for addr, code in self.code.items():
+			if cpu.icache[addr] is None:
+				cpu.icache[addr] = cpu.decode(code, addr)
+		if cpu.jit:
+			for start in sorted(self.blocks):
+				if start not in cpu.jit.blocks:
+					cpu.jit.compile(start)
+
+# recent analyses by rom hash, load address and entry
+analyses = {}
+analyses_sz = 64
+
+def analyze(rom, base=0x200, entry=0x200):
+	key = (hashlib.sha1(rom).hexdigest(), base, entry)
+	res = analyses.pop(key, None)
+	if res is None:
+		res = Analysis(rom, base, entry)
+		while len(analyses) >= analyses_sz:
+			del analyses[next(iter(analyses))]
+	analyses[key] = res
+	return res
+
+def main():
+	import argparse
+
+	parser = argparse.ArgumentParser(description='Disassemble a ROM')
+	parser.add_argument('rom', help='ROM file')
+	parser.add_argument('-f', '--format', choices=('text', 'json', 'dot'), default='text')
+	parser.add_argument('-b', '--base', type=lambda v: int(v, 0), default=0x200, help='load address')
+	parser.add_argument('-e', '--entry', type=lambda v: int(v, 0), help='entry point (default: base)')
+	args = parser.parse_args()
+
+	with open(args.rom, 'rb') as f:
+		a = analyze(f.read(), args.base, args.base if args.entry is None else args.entry)
+	print(getattr(a, args.format)(), end='')
+
+if __name__ == '__main__':
+		main()
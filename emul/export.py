@@ -0,0 +1,243 @@
+import os
+import queue
+import struct
+import threading
+import zlib
+
+# raw streams: per frame the width and height, then the packed rows
+raw_frame = struct.Struct('>HH')
+
+def expand(factor, depth):
+	# per byte of pixels, the bytes for the same pixels repeated factor
+	# times; one byte per pixel at depth 8, packed bits at depth 1
+	table = []
+	for b in range(256):
+		bits = [(b >> (7 - i)) & 1 for i in range(8) for _ in range(factor)]
+		if depth == 8:
+			table.append(bytes(bits))
+		else:
+			table.append(int(''.join(map(str, bits)), 2).to_bytes(factor, 'big'))
+	return table
+
+def rows(frame, factor, table):
+	# scaled scanlines of a (width, height, map) frame
+	width, height, map = frame
+	size = (width + 7) // 8
+	for row in map:
+		line = b''.join([table[b] for b in row.to_bytes(size, 'big')])
+		for _ in range(factor):
+			yield line
+
+def png(frame, factor):
+	# 1-bit grayscale png, lit pixels white
+	width, height, _ = frame
+	table = expand(factor, 1)
+	data = b''.join(b'\0' + line for line in rows(frame, factor, table))
+
+	def chunk(tag, body):
+		return struct.pack('>I', len(body)) + tag + body + struct.pack('>I', zlib.crc32(tag + body))
+
+	return b''.join([
+		b'\x89PNG\r\n\x1a\n',
+		chunk(b'IHDR', struct.pack('>IIBBBBB', width * factor, height * factor, 1, 0, 0, 0, 0)),
+		chunk(b'IDAT', zlib.compress(data, 9)),
+		chunk(b'IEND', b''),
+	])
+
+def lzw(pixels, min_size):
+	# gif flavoured lzw; variable code width up to 12 bits, lsb first
+	clear = 1 << min_size
+	eoi = clear + 1
+	out = bytearray()
+	acc = 0
+	bits = 0
+
+	def reset():
+		return {(-1, i): i for i in range(clear)}, eoi + 1, min_size + 1
+
+	table, next, size = reset()
+	acc |= clear << bits
+	bits += size
+
+	code = -1
+	for p in pixels:
+		key = (code, p)
+		hit = table.get(key)
+		if hit is not None:
+			code = hit
+			continue
+
+		acc |= code << bits
+		bits += size
+		while bits >= 8:
+			out.append(acc & 0xff)
+			acc >>= 8
+			bits -= 8
+
+		if next < 4095:
+			table[key] = next
+			next += 1
+			if next > (1 << size) and size < 12:
+				size += 1
+		else:
+			acc |= clear << bits
+			bits += size
+			table, next, size = reset()
+		code = table[(-1, p)]
+
+	for c in ((code, eoi) if code >= 0 else (eoi,)):
+		acc |= c << bits
+		bits += size
+		while bits >= 8:
+			out.append(acc & 0xff)
+			acc >>= 8
+			bits -= 8
+		# the decoder adds an entry for the last code too
+		if next >= (1 << size) and size < 12:
+			size += 1
+	if bits:
+		out.append(acc & 0xff)
+	return bytes(out)
+
+class Gif:
+	# two colour animated gif; frames are added with their start time in
+	# centiseconds and written once the next one shows how long they last
+	def __init__(self, path, width, height):
+		self.file = open(path, 'wb')
+		self.file.write(b'GIF89a' + struct.pack('<HHBBB', width, height, 0x80, 0, 0))
+		# black and white palette, then loop forever
+		self.file.write(b'\x00\x00\x00\xff\xff\xff')
+		self.file.write(b'\x21\xff\x0bNETSCAPE2.0\x03\x01\x00\x00\x00')
+		self.width = width
+		self.height = height
+
+	def add(self, pixels, delay):
+		f = self.file
+		f.write(b'\x21\xf9\x04\x00' + struct.pack('<H', delay) + b'\x00\x00')
+		f.write(b'\x2c' + struct.pack('<HHHHB', 0, 0, self.width, self.height, 0))
+		data = lzw(pixels, 2)
+		f.write(b'\x02')
+		for i in range(0, len(data), 255):
+			block = data[i:i+255]
+			f.write(bytes([len(block)]) + block)
+		f.write(b'\x00')
+
+	def close(self):
+		self.file.write(b'\x3b')
+		self.file.close()
+
+class Exporter:
+	# streams frames from the cpu's frame hooks to a writer thread; the
+	# hook only copies the row list. formats are 'raw' (one stream file),
+	# 'png' (a numbered file per frame in a directory) and 'gif'
+	# (identical consecutive frames merged). png and gif are scaled so
+	# that a hires pixel is scale pixels wide. at most queue_sz frames
+	# wait for the writer; when it falls further behind, frames are
+	# dropped and counted rather than stalling the cpu
+	def __init__(self, sys, path, fmt='gif', scale=2, fps=60, queue_sz=256):
+		if fmt not in ('raw', 'png', 'gif'):
+			raise ValueError('unknown export format: %s'%fmt)
+
+		self.gfx = sys.gfx
+		self.path = path
+		self.fmt = fmt
+		self.scale = scale
+		self.fps = fps
+
+		# output size is the hires resolution
+		height, width = self.gfx.base
+		self.width = width * 2
+		self.height = height * 2
+
+		self.frames = 0
+		self.dropped = 0
+		self.queue = queue.Queue(queue_sz)
+		self.error = None
+		self.thread = threading.Thread(target=self.write, daemon=True)
+		self.thread.start()
+
+		sys.cpu.frame_hooks.append(self.frame)
+
+	def frame(self, cpu):
+		gfx = self.gfx
+		if self.queue.full():
+			# a gif shows the previous frame longer, png numbers skip it
+			self.dropped += 1
+		else:
+			self.queue.put((self.frames, (gfx.width, gfx.height, gfx.map[:])))
+		self.frames += 1
+
+	def close(self):
+		# waits for everything queued to be written
+		self.queue.put(None)
+		self.thread.join()
+		if self.error:
+			raise self.error
+
+	def write(self):
+		try:
+			getattr(self, 'write_' + self.fmt)()
+		except Exception as e:
+			self.error = e
+			# keep draining so that close() returns
+			while self.queue.get() is not None:
+				pass
+
+	def frames_in(self):
+		while True:
+			item = self.queue.get()
+			if item is None:
+				return
+			yield item
+
+	def factor(self, frame):
+		return self.scale * self.width // frame[0]
+
+	def write_raw(self):
+		with open(self.path, 'wb') as f:
+			for _, frame in self.frames_in():
+				width, height, map = frame
+				size = (width + 7) // 8
+				f.write(raw_frame.pack(width, height))
+				f.write(b''.join(row.to_bytes(size, 'big') for row in map))
+
+	def write_png(self):
+		os.makedirs(self.path, exist_ok=True)
+		for n, frame in self.frames_in():
+			with open(os.path.join(self.path, '%06d.png'%n), 'wb') as f:
+				f.write(png(frame, self.factor(frame)))
+
+	def write_gif(self):
+		gif = Gif(self.path, self.width * self.scale, self.height * self.scale)
+		tables = {}
+
+		def cs(n):
+			return n * 100 // self.fps
+
+		# the frame waiting for its duration and when it started
+		pending = None
+		start = 0
+		last = 0
+		for n, frame in self.frames_in():
+			last = n
+			if pending is not None and frame[2] == pending[2] and frame[:2] == pending[:2]:
+				continue
+			# frames that would show for less than the 2 cs most viewers
+			# honour replace the one pending
+			if pending is not None and cs(n) - cs(start) >= 2:
+				self.add(gif, tables, pending, cs(n) - cs(start))
+				start = n
+			elif pending is None:
+				start = n
+			pending = frame
+
+		if pending is not None:
+			self.add(gif, tables, pending, max(cs(last + 1) - cs(start), 2))
+		gif.close()
+
+	def add(self, gif, tables, frame, delay):
+		factor = self.factor(frame)
+		table = tables.get(factor)
+		if table is None:
+			table = tables[factor] = expand(factor, 8)
+		gif.add(b''.join(rows(frame, factor, table)), delay)
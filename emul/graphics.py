@@ -1,101 +1,114 @@
-import ui
-from scene import *
-
-class Graphics(Scene):
-	def __init__(self, kbd, height=32, width=64, gfx_show_fps=False, gfx_frame_intvl=1, gfx_keysz=48, **kwargs):
-		super(Graphics, self).__init__()
-		
+class Graphics:
+	def __init__(self, height=32, width=64, **kwargs):
 		self.height = height
 		self.width = width
-		
-		self.show_fps = gfx_show_fps
-		self.frame_intvl = gfx_frame_intvl
-		self.keysz = gfx_keysz
-		
+
+		# resolution outside of the SCHIP extended mode
+		self.base = (height, width)
+
 		self.extended = False
-		
-		self.kbd = kbd
-		self.kpos = [(0, 0) for _ in range(kbd.size)]
-		
+
 		self.clear()
-	
-	def setup(self):
-		self.background_color = 'black'
-		
-	def show(self):
-		run(self, orientation=PORTRAIT, show_fps=self.show_fps, frame_interval=self.frame_intvl, multi_touch = False)
-		
-	def draw(self):
-		sw, sh = ui.get_screen_size()
-		scale = sw / self.width
-		
-		# draw title
-		text('Chip-8 Emulator', x = 10, y = 20, alignment = 9)
-		
-		# update key positions
-		self.keysz = self.keysz
-		shh = sh - self.height * scale
-		for x in range(self.kbd.col):
-			for y in range(self.kbd.row):
-				px = int(sw / 2) + (x - 2) * self.keysz
-				py = int(shh / 2) - (y - 2) * self.keysz
-				self.kpos[x + y * self.kbd.col] = (px, py)
-		
-		# draw keys
-		for i in range(self.kbd.size):
-			fill('#beb8b6' if self.kbd.pressed(i) else 'white')
-			rect(int(self.kpos[i][0]), int(self.kpos[i][1]), self.keysz - 4, self.keysz - 4)
-			
-			off = self.keysz / 2
-			tint(0, 0, 0)
-			text(
-				'%x'%self.kbd.label(i), x=int(self.kpos[i][0] + off), y=int(self.kpos[i][1] + off),
-				font_name='Courier',
-			)
-		
-		# draw screen
-		fill('white')
-		for x in range(self.width):
-			for y in range(self.height):
-				if self.map[x + y * self.width]:
-					rect(int(x * scale), int(sh - (y + 1) * scale), scale, scale)
-			
-	def touch_began(self, touch):
-		x, y = touch.location
-		
-		for i in range(self.kbd.size):
-			px = self.kpos[i][0]
-			py = self.kpos[i][1]
-			if px < x < px + self.keysz and py < y < py + self.keysz:
-				self.kbd.press(i)
-	
-	def touch_ended(self, touch):
-		self.kbd.release()
-		
-	def stop(self):
-		self.kbd.press('shutdown')
 
 	def set(self, x, y, c):
-		self.map[int(x + self.width * y)] = c
+		bit = 1 << (self.width - 1 - x)
+		if c:
+			self.map[y] |= bit
+		else:
+			self.map[y] &= ~bit
+		self.dirty[y] = True
 
 	def get(self, x, y):
-		return self.map[int(x + self.width * y)]
+		return (self.map[y] >> (self.width - 1 - x)) & 1 == 1
 
 	def clear(self):
-		self.map = [False for _ in range(self.width * self.height)]
+		# one row-packed integer per scanline; the msb is the leftmost pixel
+		self.map = [0 for _ in range(self.height)]
+		self.mask = (1 << self.width) - 1
+		self.touch()
+
+	def touch(self):
+		# rows changed since the renderer last looked; the writer sets a
+		# flag after changing the row and the renderer clears it before
+		# reading the row, so no change is missed across threads
+		self.dirty = [True for _ in range(self.height)]
+
+	def runs(self, y):
+		# horizontal runs of lit pixels in row y as (x, length)
+		row = self.map[y]
+		out = []
+		while row:
+			top = row.bit_length()
+			gap = ~row & ((1 << top) - 1)
+			low = gap.bit_length()
+			out.append((self.width - top, top - low))
+			row &= (1 << low) - 1
+		return out
+
+	def pack(self):
+		# framebuffer as bytes, row by row
+		size = (self.width + 7) // 8
+		return b''.join(row.to_bytes(size, 'big') for row in self.map)
+
+	def unpack(self, width, height, extended, data):
+		# restore a framebuffer produced by pack
+		size = (width + 7) // 8
+		self.width = width
+		self.height = height
+		self.extended = extended
+		self.mask = (1 << width) - 1
+		self.map = [int.from_bytes(data[i*size:(i+1)*size], 'big') for i in range(height)]
+		self.touch()
+
+	def blit(self, x, y, rows, w):
+		# xor w-bit sprite rows onto the screen at (x, y) with wrap-around;
+		# returns True if any lit pixel was erased
+		width = self.width
+		height = self.height
+		mask = self.mask
+		x %= width
+		dirty = self.dirty
+		hit = 0
+
+		for i, row in enumerate(rows):
+			bits = row << (width - w)
+			bits = ((bits >> x) | (bits << (width - x))) & mask
+
+			yc = (y + i) % height
+			hit |= self.map[yc] & bits
+			self.map[yc] ^= bits
+			if bits:
+				dirty[yc] = True
+
+		return hit != 0
 
 	def down(self, lines):
-		# TODO
-		return
+		# scroll by shifting row references; rows are never copied
+		if lines <= 0:
+			return
+		lines = min(lines, self.height)
+		self.map[lines:] = self.map[:self.height - lines]
+		self.map[:lines] = [0] * lines
+		self.touch()
 
-	def left(self):
-		# TODO
-		return
+	def left(self, pixels = 4):
+		mask = self.mask
+		self.map = [(row << pixels) & mask for row in self.map]
+		self.touch()
 
-	def right(self):
-		# TODO
-		return
+	def right(self, pixels = 4):
+		self.map = [row >> pixels for row in self.map]
+		self.touch()
 
 	def extend(self, on = True):
+		# switching resolution reallocates a cleared framebuffer
+		if on == self.extended:
+			return
 		self.extended = on
-		# TODO
+
+		height, width = self.base
+		if on:
+			height, width = height * 2, width * 2
+		self.height = height
+		self.width = width
+		self.clear()
@@ -0,0 +1,68 @@
+from emul.backend import Backend
+
+class Headless(Backend):
+	def __init__(self, script=(), **kwargs):
+		# scripted input; (frame, key, down) with chip-8 key values or
+		# system key names such as 'shutdown'
+		self.script = sorted(script, key=lambda e: e[0])
+		self.next = 0
+
+		# (frame, event) log of audio events
+		self.events = []
+
+		self.gfx = None
+		self.kbd = None
+		self.frames = 0
+
+	def boot(self):
+		self.events.append((self.frames, 'boot'))
+
+	def effect(self):
+		self.events.append((self.frames, 'beep'))
+
+	def shutdown(self):
+		self.events.append((self.frames, 'shutdown'))
+
+	def show(self, gfx, kbd):
+		self.gfx = gfx
+		self.kbd = kbd
+
+		# scripted input goes through the input gate so that a key wait
+		# can pull the next event; a recorder's gate takes precedence
+		if kbd.input is None:
+			kbd.input = self
+
+	def frame(self, cpu):
+		self.frames = cpu.frames
+
+		while self.next < len(self.script) and self.script[self.next][0] <= self.frames:
+			_, key, down = self.script[self.next]
+			self.next += 1
+			self.input(key, down)
+
+	def feed(self, key, down):
+		self.kbd.set(key, down)
+
+	def wait(self):
+		# a key wait (FX0A) skips ahead to the next scripted event; with
+		# none left nothing can ever be pressed, so the run ends
+		if self.next >= len(self.script):
+			self.events.append((self.frames, 'keywait'))
+			self.kbd.press('shutdown')
+			return False
+
+		_, key, down = self.script[self.next]
+		self.next += 1
+		self.input(key, down)
+		return True
+
+	def input(self, key, down):
+		if type(key) is str:
+			if down:
+				self.kbd.press(key)
+			else:
+				self.kbd.release(key)
+		elif down:
+			self.kbd.press(self.kbd.map.index(key))
+		else:
+			self.kbd.release_key(self.kbd.map.index(key))
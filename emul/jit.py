@@ -0,0 +1,125 @@
+from emul.cpu import UnknownOpcode
+
+# inlined handler bodies; register and operand values are folded in
+inline = {
+	'op_move'          : ['V[{x}] = {kk}'],
+	'op_add'           : ['V[{x}] = (V[{x}] + {kk}) & 0xff'],
+	'op_load_index'    : ['cpu.I = {nnn}'],
+	'lop_move'         : ['V[{x}] = V[{y}]'],
+	'lop_or'           : ['V[{x}] |= V[{y}]'],
+	'lop_and'          : ['V[{x}] &= V[{y}]'],
+	'lop_xor'          : ['V[{x}] ^= V[{y}]'],
+	'lop_add'          : ['s = V[{x}] + V[{y}]', 'V[15] = 1 if s > 0xff else 0', 'V[{x}] = s & 0xff'],
+	'lop_sub'          : ['s = V[{x}] - V[{y}]', 'V[15] = 0 if s < 0 else 1', 'V[{x}] = s & 0xff'],
+	'lop_subn'         : ['s = V[{y}] - V[{x}]', 'V[15] = 0 if s < 0 else 1', 'V[{x}] = s & 0xff'],
+	'lop_shr'          : ['V[15] = V[{x}] & 0x1', 'V[{x}] >>= 1'],
+	'lop_shl'          : ['V[15] = (V[{x}] & 0x80) >> 7', 'V[{x}] = (V[{x}] << 1) & 0xff'],
+	'mop_add_index'    : ['cpu.I = (cpu.I + V[{x}]) & 0xfff'],
+	'mop_load_sp_index': ['cpu.I = V[{x}] * 5'],
+}
+
+# inlined block exits; {pc} is the address after the instruction
+exits = {
+	'op_jump'        : ['cpu.pc = {nnn}'],
+	'op_skip_eq_val' : ['cpu.pc = {pc} + 2 if V[{x}] == {kk} else {pc}'],
+	'op_skip_neq_val': ['cpu.pc = {pc} + 2 if V[{x}] != {kk} else {pc}'],
+	'op_skip_eq_reg' : ['cpu.pc = {pc} + 2 if V[{x}] == V[{y}] else {pc}'],
+	'op_skip_neq_reg': ['cpu.pc = {pc} + 2 if V[{x}] != V[{y}] else {pc}'],
+}
+
+# handlers that end a basic block; everything that changes the control
+# flow, waits, draws or writes memory (the block may overwrite itself)
+ends = set(exits) | {
+	'op_call',
+	'op_jump_idle',
+	'op_jump_index',
+	'op_sprite',
+	'rop_ret',
+	'rop_exit',
+	'kop_skp',
+	'kop_sknp',
+	'mop_keyd',
+	'mop_store',
+	'mop_store_bcd',
+}
+
+class JIT:
+	def __init__(self, cpu, jit_block_sz=64, **kwargs):
+		self.cpu = cpu
+		self.block_sz = jit_block_sz
+
+		# compiled blocks keyed by entry address; (fn, end, count)
+		self.blocks = {}
+		# addresses covered by any compiled block
+		self.code = bytearray(len(cpu.ram))
+
+		cpu.ram.watch(self.invalidate)
+
+	def exe(self, budget=None):
+		# run one basic block; returns the number of instructions executed,
+		# or 0 without running it if it is longer than budget
+		blk = self.blocks.get(self.cpu.pc)
+		if blk is None:
+			blk = self.compile(self.cpu.pc)
+		if budget is not None and blk[2] > budget:
+			return 0
+		return blk[0]()
+
+	def compile(self, start):
+		cpu = self.cpu
+		src = ['def block():', '\tV = cpu.V']
+		env = {'cpu': cpu}
+
+		pc = start
+		count = 0
+		done = False
+		while not done and count < self.block_sz and pc + 1 < len(cpu.ram):
+			try:
+				ins = cpu.decode(cpu.ram[pc] << 8 | cpu.ram[pc + 1], pc)
+			except UnknownOpcode:
+				# let the interpreter fault on it when it gets there
+				if count == 0:
+					raise
+				break
+
+			name = ins.handler.__name__
+			pc += 2
+			count += 1
+			ops = dict(ins._asdict(), pc=pc)
+
+			if name in inline:
+				src += ['\t' + l.format(**ops) for l in inline[name]]
+			elif name in exits:
+				src += ['\t' + l.format(**ops) for l in exits[name]]
+				done = True
+			else:
+				h = 'h%d' % count
+				env[h] = ins.handler
+				done = name in ends
+				if done:
+					src.append('\tcpu.pc = %d' % pc)
+				src.append('\t%s(%d, %d, %d, %d, %d)' % (h, ins.x, ins.y, ins.n, ins.kk, ins.nnn))
+
+		if not done:
+			src.append('\tcpu.pc = %d' % pc)
+		src.append('\treturn %d' % count)
+
+		exec(compile('\n'.join(src), '<block %04x>' % start, 'exec'), env)
+
+		blk = self.blocks[start] = (env['block'], pc, count)
+		self.code[start:pc] = b'\x01' * (pc - start)
+		return blk
+
+	def invalidate(self, start, stop):
+		start = max(start - 1, 0)
+		if not any(self.code[start:stop]):
+			return
+
+		for addr, (_, end, _) in list(self.blocks.items()):
+			if addr < stop and start < end:
+				del self.blocks[addr]
+
+		# rebuild the coverage of the surviving blocks
+		self.code[:] = bytes(len(self.code))
+		for addr, (_, end, _) in self.blocks.items():
+			self.code[addr:end] = b'\x01' * (end - addr)
@@ -1,11 +1,9 @@
 import threading
 
 class Keyboard():
-	def __init__(self, kbd_delay=0, **kwargs):
+	def __init__(self, **kwargs):
 		self.on = True
 		
-		self.kbd_delay = kbd_delay
-		
 		self.row = 4
 		self.col = 4
 		self.size = self.row * self.col
@@ -17,8 +15,16 @@ class Keyboard():
 			0xa, 0x0, 0xb, 0xf,
 		]
 		
+		# pressed keys, bit n set while chip-8 key n is down; readers use it
+		# without locking, writers publish a new value under cv
+		self.keys = 0
+		
 		self.cv = threading.Condition()
 		
+		# optional input gate (see emul.replay); when set, ui input goes
+		# through it and reaches the keypad at deterministic points
+		self.input = None
+		
 		# system keys
 		self.syskeys = {
 			'shutdown': False,
@@ -30,17 +36,29 @@ class Keyboard():
 		if type(i) is str:
 			self.press_sys(i)
 			return
-			
+		
+		if self.input:
+			self.input.feed(self.map[i], True)
+		else:
+			self.set(self.map[i], True)
+	
+	def set(self, key, down):
+		# update the keypad; key is a chip-8 key value, None for all keys
 		with self.cv:
-			self.key = i
-			self.cv.notify()
+			if key == None:
+				self.keys = 0
+			elif down:
+				self.keys |= 1 << key
+			else:
+				self.keys &= ~(1 << key)
+			self.cv.notify_all()
 			
 	def press_sys(self, i):
 		# release cou in case it is waiting for key
 		if i == 'shutdown':
 			with self.cv:
 				self.on = False
-				self.cv.notify()
+				self.cv.notify_all()
 		
 		self.syskeys[i] = True
 		
@@ -48,28 +66,46 @@ class Keyboard():
 		if type(i) is str:
 			return self.syskeys[i]
 		
-		with self.cv:
-			return self.key == i
+		return self.keys >> self.map[i] & 1 != 0
 		
 	def release(self, i = None):
 		if type(i) is str:
 			self.syskeys[i] = False
 			return
 			
-		with self.cv:
-			self.key = None
+		if self.input:
+			self.input.feed(None, False)
+		else:
+			self.set(None, False)
+			
+	def release_key(self, i):
+		# release one keypad key and leave the others down
+		if self.input:
+			self.input.feed(self.map[i], False)
+		else:
+			self.set(self.map[i], False)
 			
 	def label(self, key):
 		return self.map[key]
 	
+	def first(self):
+		# lowest pressed chip-8 key
+		keys = self.keys
+		return (keys & -keys).bit_length() - 1 if keys else 0
+	
 	def wait(self):
+		if self.input:
+			# the gate blocks for and applies the next input event
+			while self.on and not self.keys:
+				if not self.input.wait():
+					break
+			return self.first() if self.on else 0
+		
+		# set and shutdown notify under cv, so no wake-up is lost
 		with self.cv:
-			while self.on and self.key == None:
-				self.cv.wait(0.2)
-			return self.map[self.key] if self.on else 0
+			while self.on and not self.keys:
+				self.cv.wait()
+			return self.first() if self.on else 0
 			
-	def peek(self, i):
-		# emulate key fetch delay
-		for _ in range(self.kbd_delay):
-			continue
-		return self.pressed(self.map.index(i))
+	def peek(self, key):
+		return self.keys >> (key & 0xf) & 1 != 0
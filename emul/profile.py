@@ -0,0 +1,123 @@
+import json
+import time
+
+from emul.disasm import disasm
+
+class Profiler:
+	# counts executions and host time per handler, pc, basic block and
+	# call stack. basic blocks start wherever control did not fall through
+	# from the previous instruction. frame hooks measure fps and the
+	# instructions run per frame
+	def __init__(self, path=None):
+		self.path = path
+
+		# name -> [count, ns]
+		self.handlers = {}
+		# pc -> [count, ns, opcode]
+		self.pcs = {}
+		# block entry -> [count, ns]
+		self.blocks = {}
+		# (routine entries..., handler name) -> ns
+		self.stacks = {}
+
+		# entries of the active routines, starting at the first pc
+		self.calls = None
+		self.block = None
+		self.next = None
+
+		self.instructions = 0
+		self.time = 0
+
+		# wall time of the first and last frame, instructions per frame
+		self.frames = 0
+		self.first = None
+		self.last = None
+		self.cycles = 0
+		self.ipf = []
+
+	def record(self, pc, code, name, ns):
+		if self.calls is None:
+			self.calls = [pc]
+		self.instructions += 1
+		self.time += ns
+
+		h = self.handlers.get(name)
+		if h is None:
+			h = self.handlers[name] = [0, 0]
+		h[0] += 1
+		h[1] += ns
+
+		p = self.pcs.get(pc)
+		if p is None:
+			p = self.pcs[pc] = [0, 0, code]
+		p[0] += 1
+		p[1] += ns
+
+		if pc != self.next:
+			self.block = self.blocks.get(pc)
+			if self.block is None:
+				self.block = self.blocks[pc] = [0, 0]
+			self.block[0] += 1
+		self.block[1] += ns
+		self.next = pc + 2
+
+		key = (*self.calls, name)
+		self.stacks[key] = self.stacks.get(key, 0) + ns
+
+		if name == 'op_call':
+			self.calls.append(code & 0xfff)
+		elif name == 'rop_ret' and len(self.calls) > 1:
+			self.calls.pop()
+
+	def frame(self, cpu):
+		now = time.perf_counter()
+		if self.first is None:
+			self.first = now
+		else:
+			self.ipf.append(cpu.cycles - self.cycles)
+		self.last = now
+		self.cycles = cpu.cycles
+		self.frames += 1
+
+	def report(self):
+		wall = (self.last - self.first) if self.frames > 1 else 0.0
+		ipf = self.ipf or [0]
+
+		def top(d, fmt):
+			return {fmt(k): {'count': v[0], 'time': v[1] / 1e9}
+				for k, v in sorted(d.items(), key=lambda kv: -kv[1][1])}
+
+		pcs = top(self.pcs, lambda pc: '%04x'%pc)
+		for pc, (_, _, code) in self.pcs.items():
+			pcs['%04x'%pc]['op'] = disasm(code)
+
+		return {
+			'instructions': self.instructions,
+			'time': self.time / 1e9,
+			'handlers': top(self.handlers, str),
+			'pcs': pcs,
+			'blocks': top(self.blocks, lambda pc: '%04x'%pc),
+			'frames': {
+				'count': self.frames,
+				'fps': len(self.ipf) / wall if wall else 0.0,
+				'ipf_mean': sum(ipf) / len(ipf),
+				'ipf_min': min(ipf),
+				'ipf_max': max(ipf),
+			},
+		}
+
+	def folded(self):
+		# one 'routine;routine;handler nanoseconds' line per stack
+		return ''.join(sorted('%s %d\n'%(';'.join(['%04x'%a for a in key[:-1]] + [key[-1]]), ns)
+			for key, ns in self.stacks.items()))
+
+	def save(self, path=None):
+		# the report as json next to its folded stacks
+		path = path or self.path
+		if not path:
+			return
+
+		with open(path, 'w') as f:
+			json.dump(self.report(), f, indent=1)
+		with open(path + '.folded', 'w') as f:
+			f.write(self.folded())
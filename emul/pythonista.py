@@ -0,0 +1,96 @@
+import ui
+import sound
+from scene import *
+
+from emul.backend import Backend
+
+class Screen(Scene):
+	def __init__(self, gfx, kbd, gfx_keysz=48, **kwargs):
+		super(Screen, self).__init__()
+
+		self.gfx = gfx
+		self.kbd = kbd
+		self.keysz = gfx_keysz
+		self.kpos = [(0, 0) for _ in range(kbd.size)]
+
+		# lit runs per row, rebuilt only for rows the cpu has touched
+		self.rows = []
+
+	def setup(self):
+		self.background_color = 'black'
+
+	def draw(self):
+		gfx = self.gfx
+		sw, sh = ui.get_screen_size()
+		scale = sw / gfx.width
+
+		# draw title
+		text('Chip-8 Emulator', x = 10, y = 20, alignment = 9)
+
+		# update key positions
+		shh = sh - gfx.height * scale
+		for x in range(self.kbd.col):
+			for y in range(self.kbd.row):
+				px = int(sw / 2) + (x - 2) * self.keysz
+				py = int(shh / 2) - (y - 2) * self.keysz
+				self.kpos[x + y * self.kbd.col] = (px, py)
+
+		# draw keys
+		for i in range(self.kbd.size):
+			fill('#beb8b6' if self.kbd.pressed(i) else 'white')
+			rect(int(self.kpos[i][0]), int(self.kpos[i][1]), self.keysz - 4, self.keysz - 4)
+
+			off = self.keysz / 2
+			tint(0, 0, 0)
+			text(
+				'%x'%self.kbd.label(i), x=int(self.kpos[i][0] + off), y=int(self.kpos[i][1] + off),
+				font_name='Courier',
+			)
+
+		# draw screen
+		dirty = gfx.dirty
+		if len(self.rows) != gfx.height:
+			self.rows = [[] for _ in range(gfx.height)]
+			dirty = [True] * gfx.height
+
+		fill('white')
+		for y in range(gfx.height):
+			if dirty[y]:
+				dirty[y] = False
+				self.rows[y] = gfx.runs(y)
+			for x, w in self.rows[y]:
+				rect(int(x * scale), int(sh - (y + 1) * scale), w * scale, scale)
+
+	def touch_began(self, touch):
+		x, y = touch.location
+
+		for i in range(self.kbd.size):
+			px = self.kpos[i][0]
+			py = self.kpos[i][1]
+			if px < x < px + self.keysz and py < y < py + self.keysz:
+				self.kbd.press(i)
+
+	def touch_ended(self, touch):
+		self.kbd.release()
+
+	def stop(self):
+		self.kbd.press('shutdown')
+
+class Pythonista(Backend):
+	def __init__(self, gfx_show_fps=False, gfx_frame_intvl=1, **kwargs):
+		self.show_fps = gfx_show_fps
+		self.frame_intvl = gfx_frame_intvl
+		self.kwargs = kwargs
+
+	def boot(self):
+		sound.play_effect('game:Woosh_1')
+
+	def effect(self):
+		sound.play_effect('game:Beep')
+
+	def shutdown(self):
+		sound.play_effect('game:Woosh_2')
+
+	def show(self, gfx, kbd):
+		self.screen = Screen(gfx, kbd, **self.kwargs)
+		run(self.screen, orientation=PORTRAIT, show_fps=self.show_fps, frame_interval=self.frame_intvl, multi_touch = False)
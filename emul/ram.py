@@ -17,7 +17,40 @@ fontset=bytearray([
 	0xF0, 0x80, 0xF0, 0x80, 0x80  # F
 ])
 
+# SCHIP 8x10 digits, loaded right after the small font
+bigfont_addr = 0x50
+bigfont=bytearray([
+	0x3C, 0x7E, 0xE7, 0xC3, 0xC3, 0xC3, 0xC3, 0xE7, 0x7E, 0x3C, # 0
+	0x18, 0x38, 0x58, 0x18, 0x18, 0x18, 0x18, 0x18, 0x18, 0x3C, # 1
+	0x3E, 0x7F, 0xC3, 0x06, 0x0C, 0x18, 0x30, 0x60, 0xFF, 0xFF, # 2
+	0x3C, 0x7E, 0xC3, 0x03, 0x0E, 0x0E, 0x03, 0xC3, 0x7E, 0x3C, # 3
+	0x06, 0x0E, 0x1E, 0x36, 0x66, 0xC6, 0xFF, 0xFF, 0x06, 0x06, # 4
+	0xFF, 0xFF, 0xC0, 0xC0, 0xFC, 0xFE, 0x03, 0xC3, 0x7E, 0x3C, # 5
+	0x3E, 0x7C, 0xE0, 0xC0, 0xFC, 0xFE, 0xC3, 0xC3, 0x7E, 0x3C, # 6
+	0xFF, 0xFF, 0x03, 0x06, 0x0C, 0x18, 0x30, 0x60, 0x60, 0x60, # 7
+	0x3C, 0x7E, 0xC3, 0xC3, 0x7E, 0x7E, 0xC3, 0xC3, 0x7E, 0x3C, # 8
+	0x3C, 0x7E, 0xC3, 0xC3, 0x7F, 0x3F, 0x03, 0x03, 0x3E, 0x7C  # 9
+])
+
 class Ram(bytearray):
 	def __init__(self, size=4096):
-		super(Ram, self).__init__(4096)
+		super(Ram, self).__init__(size)
+		self.watchers = []
 		self[0:0+len(fontset)] = fontset
+		self[bigfont_addr:bigfont_addr+len(bigfont)] = bigfont
+
+	def watch(self, fn):
+		# fn(start, stop) is called after every write
+		self.watchers.append(fn)
+
+	def __setitem__(self, key, value):
+		super(Ram, self).__setitem__(key, value)
+
+		if type(key) is slice:
+			start, stop, _ = key.indices(len(self))
+		else:
+			start = key % len(self)
+			stop = start + 1
+
+		for fn in self.watchers:
+			fn(start, stop)
@@ -0,0 +1,142 @@
+import struct
+from collections import deque
+
+from emul.headless import Headless
+from emul.system import System
+
+magic = b'C8IN'
+version = 1
+
+# magic, version, seed, instructions per second, last cycle, event count
+header = struct.Struct('>4sHIIQI')
+# cycle, chip-8 key (-1 for none), flags
+event = struct.Struct('>QbB')
+
+DOWN = 0x1
+# consumed by a key wait (FX0A) rather than at a frame boundary
+WAIT = 0x2
+
+class Log:
+	def __init__(self, seed=0, ips=600, end=0, events=None):
+		self.seed = seed
+		self.ips = ips
+		self.end = end
+		# (cycle, key, flags)
+		self.events = events if events != None else []
+
+	def dumps(self):
+		out = bytearray(header.pack(magic, version, self.seed, self.ips, self.end, len(self.events)))
+		for cycle, key, flags in self.events:
+			out += event.pack(cycle, -1 if key == None else key, flags)
+		return bytes(out)
+
+	@classmethod
+	def loads(cls, blob):
+		tag, ver, seed, ips, end, count = header.unpack_from(blob)
+		if tag != magic or ver != version:
+			raise ValueError('not a version %d input log'%version)
+
+		events = []
+		for i in range(count):
+			cycle, key, flags = event.unpack_from(blob, header.size + i * event.size)
+			events.append((cycle, None if key < 0 else key, flags))
+		return cls(seed, ips, end, events)
+
+	def save(self, path):
+		with open(path, 'wb') as f:
+			f.write(self.dumps())
+
+	@classmethod
+	def load(cls, path):
+		with open(path, 'rb') as f:
+			return cls.loads(f.read())
+
+class Recorder:
+	# queues ui input and applies it to the keypad at frame boundaries or
+	# key waits, logging the cycle number of each event
+	def __init__(self, sys):
+		if not sys.cpu.deterministic:
+			raise ValueError('recording requires cpu_deterministic')
+
+		self.cpu = sys.cpu
+		self.kbd = sys.kbd
+		self.log = Log(self.cpu.rand, self.cpu.ips)
+		self.pending = deque()
+
+		self.kbd.input = self
+		self.cpu.frame_hooks.append(self.sync)
+
+	def feed(self, key, down):
+		with self.kbd.cv:
+			self.pending.append((key, down))
+			self.kbd.cv.notify_all()
+
+	def apply(self, key, down, flags=0):
+		self.log.events.append((self.cpu.cycles, key, flags | (DOWN if down else 0)))
+		self.kbd.set(key, down)
+
+	def sync(self, cpu):
+		while self.pending:
+			self.apply(*self.pending.popleft())
+		self.log.end = cpu.cycles
+
+	def wait(self):
+		with self.kbd.cv:
+			while self.kbd.on and not self.pending:
+				self.kbd.cv.wait()
+		if not self.pending:
+			return False
+
+		key, down = self.pending.popleft()
+		self.apply(key, down, WAIT)
+		return True
+
+class Player:
+	# feeds a recorded log back into the keypad at the same cycles; live
+	# input is ignored
+	def __init__(self, sys, log):
+		self.cpu = sys.cpu
+		self.kbd = sys.kbd
+		self.events = log.events
+		self.next = 0
+
+		self.cpu.rand = log.seed
+		self.kbd.input = self
+		self.cpu.frame_hooks.append(self.sync)
+
+	def feed(self, key, down):
+		pass
+
+	def apply(self):
+		_, key, flags = self.events[self.next]
+		self.next += 1
+		self.kbd.set(key, flags & DOWN != 0)
+
+	def sync(self, cpu):
+		while self.next < len(self.events):
+			cycle, _, flags = self.events[self.next]
+			if flags & WAIT or cycle > cpu.cycles:
+				break
+			self.apply()
+
+	def wait(self):
+		if self.next >= len(self.events) or not self.events[self.next][2] & WAIT:
+			# the recording ended while waiting for a key
+			self.kbd.press('shutdown')
+			return False
+
+		self.apply()
+		return True
+
+def replay(rom, log, **kwargs):
+	# run a recorded session headless at full speed; returns the system
+	kwargs.update(
+		cpu_deterministic=True,
+		cpu_throttle=False,
+		cpu_ips=log.ips,
+		cpu_seed=log.seed)
+
+	sys = System(backend=Headless(), **kwargs)
+	Player(sys, log)
+	sys.start(rom, log.end)
+	return sys
@@ -0,0 +1,128 @@
+import re
+import struct
+import zlib
+from array import array
+from collections import deque
+
+span = struct.Struct('>II')
+nonzero = re.compile(rb'[^\x00]+')
+
+def xor(a, b):
+	return (int.from_bytes(a, 'little') ^ int.from_bytes(b, 'little')).to_bytes(len(a), 'little')
+
+class Group:
+	# a compressed keyframe followed by sparse xor deltas; only the newest
+	# group is open, older ones keep their deltas compressed
+	def __init__(self, key):
+		self.key = zlib.compress(key)
+		self.data = bytearray()
+		self.ends = array('I')
+		self.open = True
+
+	def __len__(self):
+		return 1 + len(self.ends)
+
+	def add(self, delta):
+		# spans of changed bytes as (offset, length, bytes)
+		for m in nonzero.finditer(delta):
+			self.data += span.pack(m.start(), m.end() - m.start())
+			self.data += m.group()
+		self.ends.append(len(self.data))
+
+	def close(self):
+		self.data = zlib.compress(self.data)
+		self.open = False
+
+	def reopen(self):
+		if not self.open:
+			self.data = bytearray(zlib.decompress(self.data))
+			self.open = True
+
+	def state(self, i):
+		# the full snapshot of entry i
+		blob = bytearray(zlib.decompress(self.key))
+		if i == 0:
+			return blob
+
+		data = self.data if self.open else zlib.decompress(self.data)
+		off = 0
+		while off < self.ends[i - 1]:
+			pos, size = span.unpack_from(data, off)
+			off += span.size
+			blob[pos:pos+size] = xor(blob[pos:pos+size], data[off:off+size])
+			off += size
+		return blob
+
+	def truncate(self, i):
+		# keep entries up to and including i
+		self.reopen()
+		del self.data[self.ends[i - 1] if i else 0:]
+		del self.ends[i:]
+
+	def size(self):
+		return len(self.key) + len(self.data) + len(self.ends) * self.ends.itemsize
+
+class Rewind:
+	# keeps the last seconds of state, one entry per frame
+	def __init__(self, sys, seconds=10, keyframe=300, fps=60):
+		self.sys = sys
+		self.capacity = seconds * fps
+		self.keyframe = keyframe
+
+		self.groups = deque()
+		self.count = 0
+		self.last = None
+
+		sys.cpu.frame_hooks.append(self.push)
+
+	def __len__(self):
+		return self.count
+
+	def push(self, cpu=None):
+		blob = self.sys.snapshot()
+
+		if self.last is None or len(blob) != len(self.last) or len(self.groups[-1]) >= self.keyframe:
+			if self.groups:
+				self.groups[-1].close()
+			self.groups.append(Group(blob))
+		else:
+			self.groups[-1].add(xor(blob, self.last))
+
+		self.last = blob
+		self.count += 1
+
+		# drop whole groups while the rest still covers the window
+		while self.count - len(self.groups[0]) >= self.capacity:
+			self.count -= len(self.groups.popleft())
+
+	def locate(self, back):
+		# group index and entry of the frame back frames before the newest
+		if not 0 <= back < self.count:
+			raise IndexError('frame %d is not in the rewind buffer'%back)
+
+		i = self.count - 1 - back
+		for g, group in enumerate(self.groups):
+			if i < len(group):
+				return g, i
+			i -= len(group)
+
+	def state(self, back=0):
+		g, i = self.locate(back)
+		return bytes(self.groups[g].state(i))
+
+	def rewind(self, back):
+		# restore an earlier frame and forget everything after it
+		g, i = self.locate(back)
+		blob = bytes(self.groups[g].state(i))
+
+		while len(self.groups) > g + 1:
+			self.groups.pop()
+		self.groups[g].truncate(i)
+		self.count -= back
+		self.last = blob
+
+		self.sys.restore(blob)
+
+	def size(self):
+		# bytes held by the history
+		return sum(group.size() for group in self.groups)
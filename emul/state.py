@@ -0,0 +1,67 @@
+import struct
+from array import array
+
+magic = b'C8ST'
+version = 2
+
+# magic, version, pc, sp, I, stack size, ram size, width, height,
+# extended, delay timer, sound timer, sound armed, rng state, cycles,
+# frames
+header = struct.Struct('>4sHHHHHIHHBBBBIQQ')
+
+# followed by V0..VF, rpl, the stack as 16-bit words, ram and the
+# row-packed framebuffer
+
+def save(sys):
+	cpu = sys.cpu
+	gfx = sys.gfx
+
+	return b''.join([
+		header.pack(
+			magic, version,
+			cpu.pc, cpu.sp, cpu.I & 0xffff,
+			cpu.stack_sz, len(sys.ram), gfx.width, gfx.height, gfx.extended,
+			cpu.delay_timer.get(), cpu.sound_timer.get(), cpu.sound_timer.armed,
+			cpu.rand, cpu.cycles, cpu.frames),
+		bytes(cpu.V),
+		bytes(cpu.rpl),
+		struct.pack('>%dH'%cpu.stack_sz, *cpu.stack),
+		memoryview(sys.ram),
+		gfx.pack(),
+	])
+
+def load(sys, blob):
+	cpu = sys.cpu
+	gfx = sys.gfx
+	mv = memoryview(blob)
+
+	(tag, ver, pc, sp, I, stack_sz, ram_sz, width, height, extended,
+		delay, sound, armed, rand, cycles, frames) = header.unpack_from(mv)
+
+	if tag != magic or ver != version:
+		raise ValueError('not a version %d snapshot'%version)
+	if stack_sz != cpu.stack_sz or ram_sz != len(sys.ram):
+		raise ValueError('snapshot does not match the machine configuration')
+
+	off = header.size
+	cpu.V[:] = mv[off:off+16]
+	off += 16
+	cpu.rpl[:] = mv[off:off+16]
+	off += 16
+	cpu.stack[:] = array('H', struct.unpack_from('>%dH'%stack_sz, mv, off))
+	off += stack_sz * 2
+	sys.ram[:] = mv[off:off+ram_sz]
+	off += ram_sz
+	gfx.unpack(width, height, extended == 1, mv[off:])
+
+	cpu.pc = pc
+	cpu.sp = sp
+	cpu.I = I
+	cpu.rand = rand
+	cpu.cycles = cycles
+	cpu.frames = frames
+
+	# timers restart from their saved values at the current clock
+	cpu.delay_timer.set(delay)
+	cpu.sound_timer.set(sound)
+	cpu.sound_timer.armed = armed == 1
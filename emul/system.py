@@ -1,27 +1,58 @@
 from emul.cpu import CPU
-from emul.audio import Audio
+from emul.backend import load
 from emul.graphics import Graphics
 from emul.keyboard import Keyboard
 from emul.ram import Ram
+from emul.rewind import Rewind
+from emul import state
 
 class System:
-	def __init__(self, **kwargs):
-		self.entry = kwargs['cpu_entry']
-		self.ld_addr = kwargs['cpu_ld_addr']
+	def __init__(self, backend=None, **kwargs):
+		self.entry = kwargs.get('cpu_entry', 0x200)
+		self.ld_addr = kwargs.get('cpu_ld_addr', 0x200)
+		self.analyze = kwargs.get('cpu_analyze', True)
+		
+		# recordings only replay on the emulated clock
+		if kwargs.get('sys_record'):
+			kwargs['cpu_deterministic'] = True
 		
 		self.kbd = Keyboard(**kwargs)
 		
-		self.audio = Audio()
-		self.gfx = Graphics(self.kbd, **kwargs)
+		if backend is None:
+			backend = load(kwargs.get('sys_backend', 'pythonista'), **kwargs)
+		self.backend = backend
+		self.gfx = Graphics(**kwargs)
 		
-		self.ram = Ram(kwargs['ram_sz'])
+		self.ram = Ram(kwargs.get('ram_sz', 4096))
 		
 		self.cpu = CPU(
 			ram=self.ram, 
 			kbd=self.kbd, 
 			gfx=self.gfx, 
-			audio=self.audio, 
+			backend=self.backend, 
 			**kwargs)
+		self.cpu.frame_hooks.append(self.backend.frame)
+		
+		# frame history for rewinding; off when zero
+		secs = kwargs.get('sys_rewind', 0)
+		self.rewind = Rewind(self, secs, fps=kwargs.get('cpu_frame_hz', 60)) if secs else None
+		
+		# input recording for deterministic replays
+		self.record = kwargs.get('sys_record')
+		self.recorder = None
+		if self.record:
+			from emul.replay import Recorder
+			self.recorder = Recorder(self)
+		
+		# frames written out as raw, png or gif while running
+		self.exporter = None
+		if kwargs.get('sys_export'):
+			from emul.export import Exporter
+			self.exporter = Exporter(self, kwargs['sys_export'],
+				kwargs.get('sys_export_fmt', 'gif'),
+				kwargs.get('sys_export_scale', 2),
+				kwargs.get('cpu_frame_hz', 60),
+				kwargs.get('sys_export_queue', 256))
 	
 	def __enter__(self):
 		return self
@@ -29,15 +60,35 @@ class System:
 	def __exit__(self, val, type, tb):
 		pass
 		
-	def start(self, rom):
-		self.audio.boot()
+	def start(self, rom, cycles=None):
+		self.backend.boot()
 		
-		self.gfx.show()
+		self.backend.show(self.gfx, self.kbd)
 		
-		ep = self.entry
+		self.load(rom)
+		try:
+			self.cpu.run(self.entry, cycles)
+		finally:
+			if self.recorder:
+				self.recorder.log.save(self.record)
+			if self.exporter:
+				self.exporter.close()
+			self.backend.shutdown()
+	
+	def load(self, rom):
+		# rom is any buffer; memoryviews are copied straight into ram
 		lp = self.ld_addr
-		
+		if len(rom) > len(self.ram) - lp:
+			raise ValueError('rom of %d bytes does not fit in %d bytes at %03x'%(len(rom), len(self.ram) - lp, lp))
 		self.ram[lp:lp+len(rom)] = rom
-		self.cpu.run(ep)
 		
-		self.audio.shutdown()
+		# predecode the reachable code up front
+		if self.analyze:
+			from emul.disasm import analyze
+			analyze(rom, lp, self.entry).seed(self.cpu)
+	
+	def snapshot(self):
+		return state.save(self)
+	
+	def restore(self, blob):
+		state.load(self, blob)
@@ -1,44 +1,34 @@
-import threading
 import time
 
-class Timer(threading.Thread):
-	def __init__(self, freq = 60.0, event = None):
-		super(Timer, self).__init__()
-		
+class Timer:
+	# counts down at freq without a thread; the value is derived from the
+	# clock whenever it is read
+	def __init__(self, freq = 60.0, event = None, clock = time.monotonic):
 		self.freq = freq
 		self.event = event
-		self.lock = threading.Lock()
+		self.clock = clock
+
+		# value and clock time of the last set
 		self.c = 0
-		self.on = True
-		
-		self.start()
-		
-	def __del__(self):
-		self.on = False
-		self.join()
-	
+		self.t = clock()
+
+		# event is due when the timer runs out
+		self.armed = False
+
 	def set(self, c):
-		with self.lock:
-			self.c = c
-			
+		self.c = c
+		self.t = self.clock()
+		self.armed = c > 0 and self.event != None
+
 	def get(self):
-		with self.lock:
-			return self.c
-	
-	def run(self):
-		while self.on:
-			self.delay(1.0 / self.freq)
-			
-			with self.lock:
-				if self.c == 1 and self.event != None:
-					self.event()
-				
-				self.c = self.c - 1 if self.c > 0 else 0
-				
-	def delay(self, d):
-		t = time.time()
-		while time.time() <= t + d:
-			try:
-				time.sleep(d)
-			except:
-				continue
+		if self.c == 0:
+			return 0
+
+		c = self.c - int((self.clock() - self.t) * self.freq)
+		return c if c > 0 else 0
+
+	def poll(self):
+		# called from the scheduler; fires the event once the timer expired
+		if self.armed and self.get() == 0:
+			self.armed = False
+			self.event()
@@ -0,0 +1,55 @@
+import struct
+
+from emul.disasm import disasm
+
+# pc, opcode, I, V0..VF
+entry = struct.Struct('>HHH16s')
+
+class Tracer:
+	# records executed instructions into a preallocated ring buffer.
+	# with a path, full buffers are disassembled and written out in
+	# chunks; without one, the buffer keeps the most recent entries
+	def __init__(self, path=None, size=4096):
+		self.size = size
+		self.buf = bytearray(entry.size * size)
+		self.pos = 0
+		self.wrapped = False
+
+		self.file = open(path, 'w') if path else None
+
+	def record(self, pc, code, I, V):
+		entry.pack_into(self.buf, self.pos * entry.size, pc, code, I & 0xffff, bytes(V))
+		self.pos += 1
+
+		if self.pos == self.size:
+			if self.file:
+				self.flush()
+			else:
+				self.pos = 0
+				self.wrapped = True
+
+	def entries(self):
+		# oldest first
+		order = list(range(self.pos, self.size)) if self.wrapped else []
+		order += range(self.pos)
+		for i in order:
+			pc, code, I, V = entry.unpack_from(self.buf, i * entry.size)
+			yield pc, code, I, V
+
+	def format(self):
+		return ''.join('%04x    %04x: %-16s I=%04x V=%s\n'%(pc, code, disasm(code), I, V.hex())
+			for pc, code, I, V in self.entries())
+
+	def flush(self):
+		if not self.file:
+			return
+
+		self.file.write(self.format())
+		self.file.flush()
+		self.pos = 0
+
+	def close(self):
+		self.flush()
+		if self.file:
+			self.file.close()
+			self.file = None
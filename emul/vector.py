@@ -0,0 +1,349 @@
+import numpy as np
+
+from emul.ram import fontset, bigfont, bigfont_addr
+
+class VectorCPU:
+	# runs the same program on many instances in lockstep; each instance
+	# behaves like a deterministic emul.cpu.CPU without the SCHIP display
+	# extensions. instances that fault are halted and keep their state
+	# for inspection
+	def __init__(self, count, seeds=None, cpu_stack_sz=24, cpu_ips=600, cpu_frame_hz=60, cpu_delay_hz=60, cpu_sound_hz=60, height=32, width=64, **kwargs):
+		self.count = count
+		self.stack_sz = cpu_stack_sz
+		self.ips = cpu_ips
+		self.frame_hz = cpu_frame_hz
+		self.delay_hz = cpu_delay_hz
+		self.sound_hz = cpu_sound_hz
+		self.height = height
+		self.width = width
+
+		# registers
+		self.pc = np.zeros(count, np.int64)
+		self.sp = np.zeros(count, np.int64)
+		self.I = np.zeros(count, np.int64)
+		self.V = np.zeros((count, 16), np.int64)
+
+		# memory structures; ram is widened when computing with it
+		self.ram = np.zeros((count, 4096), np.uint8)
+		self.ram[:, :len(fontset)] = np.frombuffer(bytes(fontset), np.uint8)
+		self.ram[:, bigfont_addr:bigfont_addr+len(bigfont)] = np.frombuffer(bytes(bigfont), np.uint8)
+		self.stack = np.zeros((count, self.stack_sz), np.int64)
+		self.rpl = np.zeros((count, 16), np.int64)
+		self.fb = np.zeros((count, height, width), bool)
+
+		# timers like emul.timer.Timer on the emulated clock; the value
+		# and clock time of the last set
+		self.delay = np.zeros(count, np.int64)
+		self.delay_t = np.zeros(count, np.float64)
+		self.sound = np.zeros(count, np.int64)
+		self.sound_t = np.zeros(count, np.float64)
+		self.armed = np.zeros(count, bool)
+		self.beeps = np.zeros(count, np.int64)
+		self.keys = np.zeros((count, 16), bool)
+
+		# faults; pc and opcode of the faulting instruction
+		self.halted = np.zeros(count, bool)
+		self.fault_pc = np.zeros(count, np.int64)
+		self.fault_code = np.zeros(count, np.int64)
+		# powered off by 00FD; pc stays on the exit
+		self.off = np.zeros(count, bool)
+
+		# xorshift32 state seeded like CPU with cpu_seed
+		seeds = np.array(range(count) if seeds is None else seeds, np.int64) & 0xffffffff
+		self.rand = np.where(seeds == 0, 0x2545f491, seeds).astype(np.uint32)
+
+		self.cycles = 0
+		self.frames = 0
+		# cycles at the start of the frame; CPU counts a batch at its end
+		self.start = 0
+
+		self.op = {
+			0x0: self.op_sys,
+			0x1: self.op_jump,
+			0x2: self.op_call,
+			0x3: self.op_skip_eq_val,
+			0x4: self.op_skip_neq_val,
+			0x5: self.op_skip_eq_reg,
+			0x6: self.op_move,
+			0x7: self.op_add,
+			0x8: self.op_logic,
+			0x9: self.op_skip_neq_reg,
+			0xa: self.op_load_index,
+			0xb: self.op_jump_index,
+			0xc: self.op_rand,
+			0xd: self.op_sprite,
+			0xe: self.op_kbd,
+			0xf: self.op_misc,
+		}
+
+	def load(self, rom, addr=0x200, pc=0x200):
+		self.ram[:, addr:addr+len(rom)] = np.frombuffer(bytes(rom), np.uint8)
+		self.pc[:] = pc
+
+	def run(self, cycles):
+		# frames are scheduled like CPU.run, remainder of ips / hz included
+		end = self.cycles + cycles
+		while self.cycles < end:
+			f = self.frames
+			count = (f + 1) * self.ips // self.frame_hz - f * self.ips // self.frame_hz
+			for _ in range(min(count, end - self.cycles)):
+				self.step()
+			self.frame()
+
+	def frame(self):
+		self.start = self.cycles
+
+		# the sound event fires once the timer ran out, like Timer.poll
+		k = np.nonzero(self.armed)[0]
+		done = k[self.timer(k, self.sound, self.sound_t, self.sound_hz) == 0]
+		self.armed[done] = False
+		self.beeps[done] += 1
+		self.frames += 1
+
+	def clock(self):
+		# emulated seconds
+		return self.start / self.ips
+
+	def timer(self, k, c, t, freq):
+		v = c[k] - ((self.clock() - t[k]) * freq).astype(np.int64)
+		return np.maximum(v, 0)
+
+	def timers(self):
+		# current delay and sound timer values
+		k = np.arange(self.count)
+		return (self.timer(k, self.delay, self.delay_t, self.delay_hz),
+			self.timer(k, self.sound, self.sound_t, self.sound_hz))
+
+	def step(self):
+		k = np.nonzero(~(self.halted | self.off))[0]
+		pc = self.pc[k]
+
+		# fetching past the end of ram halts the instance
+		bad = pc + 1 >= self.ram.shape[1]
+		if bad.any():
+			self.halted[k[bad]] = True
+			self.fault_pc[k[bad]] = pc[bad]
+			k = k[~bad]
+			pc = pc[~bad]
+
+		code = self.ram[k, pc].astype(np.int64) << 8 | self.ram[k, pc + 1]
+		self.pc[k] = pc + 2
+
+		hi = code >> 12
+		for op in np.unique(hi):
+			m = hi == op
+			c = code[m]
+			self.op[op](k[m], (c >> 8) & 0xf, (c >> 4) & 0xf, c & 0xf, c & 0xff, c & 0xfff, c)
+
+		self.cycles += 1
+
+	def fault(self, k, code):
+		# like an unknown opcode, pc stays on the faulting instruction
+		self.pc[k] -= 2
+		self.halted[k] = True
+		self.fault_pc[k] = self.pc[k]
+		self.fault_code[k] = code
+
+	def skip(self, k, cond):
+		self.pc[k[cond]] += 2
+
+	def op_sys(self, k, x, y, n, kk, nnn, code):
+		known = (kk == 0x00) | (kk == 0xe0) | (kk == 0xee) | (kk == 0xfd)
+		if not known.all():
+			self.fault(k[~known], code[~known])
+
+		cls = k[kk == 0xe0]
+		self.fb[cls] = False
+
+		# stay on the exit and power off
+		ext = k[kk == 0xfd]
+		self.pc[ext] -= 2
+		self.off[ext] = True
+
+		ret = k[kk == 0xee]
+		empty = self.sp[ret] <= 0
+		if empty.any():
+			# CPU has already stepped past the return when it underflows
+			self.fault(ret[empty], code[kk == 0xee][empty])
+			self.pc[ret[empty]] += 2
+			ret = ret[~empty]
+		self.sp[ret] -= 1
+		self.pc[ret] = self.stack[ret, self.sp[ret]]
+
+	def op_jump(self, k, x, y, n, kk, nnn, code):
+		self.pc[k] = nnn
+
+	def op_call(self, k, x, y, n, kk, nnn, code):
+		full = self.sp[k] >= self.stack_sz
+		if full.any():
+			# CPU has already stepped past the call when it overflows
+			self.fault(k[full], code[full])
+			self.pc[k[full]] += 2
+			k = k[~full]
+			nnn = nnn[~full]
+
+		self.stack[k, self.sp[k]] = self.pc[k]
+		self.sp[k] += 1
+		self.pc[k] = nnn
+
+	def op_skip_eq_val(self, k, x, y, n, kk, nnn, code):
+		self.skip(k, self.V[k, x] == kk)
+
+	def op_skip_neq_val(self, k, x, y, n, kk, nnn, code):
+		self.skip(k, self.V[k, x] != kk)
+
+	def op_skip_eq_reg(self, k, x, y, n, kk, nnn, code):
+		self.skip(k, self.V[k, x] == self.V[k, y])
+
+	def op_skip_neq_reg(self, k, x, y, n, kk, nnn, code):
+		self.skip(k, self.V[k, x] != self.V[k, y])
+
+	def op_move(self, k, x, y, n, kk, nnn, code):
+		self.V[k, x] = kk
+
+	def op_add(self, k, x, y, n, kk, nnn, code):
+		self.V[k, x] = (self.V[k, x] + kk) & 0xff
+
+	def op_load_index(self, k, x, y, n, kk, nnn, code):
+		self.I[k] = nnn
+
+	def op_jump_index(self, k, x, y, n, kk, nnn, code):
+		self.pc[k] = (self.V[k, 0] + nnn) & 0xfff
+
+	def op_rand(self, k, x, y, n, kk, nnn, code):
+		r = self.rand[k]
+		r ^= r << 13
+		r ^= r >> 17
+		r ^= r << 5
+		self.rand[k] = r
+		self.V[k, x] = kk & r
+
+	def op_sprite(self, k, x, y, n, kk, nnn, code):
+		V = self.V
+		xs = (V[k, x][:, None] + np.arange(8)) % self.width
+		ys = V[k, y]
+		I = self.I[k]
+		hit = np.zeros(len(k), bool)
+
+		for r in range(int(n.max()) if len(n) else 0):
+			# rows past the sprite height or the end of ram are not drawn
+			m = (r < n) & (I + r < self.ram.shape[1])
+			if not m.any():
+				continue
+
+			km = k[m]
+			row = self.ram[km, I[m] + r]
+			bits = ((row[:, None] >> (7 - np.arange(8))) & 1).astype(bool)
+			yc = ((ys[m] + r) % self.height)[:, None]
+
+			old = self.fb[km[:, None], yc, xs[m]]
+			hit[m] |= (old & bits).any(axis=1)
+			self.fb[km[:, None], yc, xs[m]] = old ^ bits
+
+		V[k, 15] = hit
+
+	def op_logic(self, k, x, y, n, kk, nnn, code):
+		V = self.V
+		known = np.isin(n, (0x0, 0x1, 0x2, 0x3, 0x4, 0x5, 0x6, 0x7, 0xe))
+		if not known.all():
+			self.fault(k[~known], code[~known])
+
+		for op in np.unique(n[known]):
+			m = n == op
+			km, xm, ym = k[m], x[m], y[m]
+			vx = V[km, xm]
+			vy = V[km, ym]
+
+			# the carry flag is written before the result, like CPU does
+			if op == 0x0:
+				V[km, xm] = vy
+			elif op == 0x1:
+				V[km, xm] = vx | vy
+			elif op == 0x2:
+				V[km, xm] = vx & vy
+			elif op == 0x3:
+				V[km, xm] = vx ^ vy
+			elif op == 0x4:
+				s = vx + vy
+				V[km, 15] = s > 0xff
+				V[km, xm] = s & 0xff
+			elif op == 0x5:
+				s = vx - vy
+				V[km, 15] = s >= 0
+				V[km, xm] = s & 0xff
+			elif op == 0x7:
+				s = vy - vx
+				V[km, 15] = s >= 0
+				V[km, xm] = s & 0xff
+			elif op == 0x6:
+				V[km, 15] = vx & 0x1
+				V[km, xm] = (V[km, xm] >> 1) & 0xff
+			elif op == 0xe:
+				V[km, 15] = (vx & 0x80) >> 7
+				V[km, xm] = (V[km, xm] << 1) & 0xff
+
+	def op_kbd(self, k, x, y, n, kk, nnn, code):
+		known = (kk == 0x9e) | (kk == 0xa1)
+		if not known.all():
+			self.fault(k[~known], code[~known])
+
+		down = self.keys[k, self.V[k, x] & 0xf]
+		self.skip(k, (kk == 0x9e) & down)
+		self.skip(k, (kk == 0xa1) & ~down)
+
+	def op_misc(self, k, x, y, n, kk, nnn, code):
+		V = self.V
+		known = np.isin(kk, (0x07, 0x0a, 0x15, 0x18, 0x1e, 0x29, 0x30, 0x33, 0x55, 0x65, 0x75, 0x85))
+		if not known.all():
+			self.fault(k[~known], code[~known])
+
+		for op in np.unique(kk[known]):
+			m = kk == op
+			km, xm = k[m], x[m]
+
+			if op == 0x07:
+				V[km, xm] = self.timer(km, self.delay, self.delay_t, self.delay_hz)
+			elif op == 0x0a:
+				# no key yet; execute the wait again next step
+				keys = self.keys[km]
+				down = keys.any(axis=1)
+				self.pc[km[~down]] -= 2
+				V[km[down], xm[down]] = keys[down].argmax(axis=1)
+			elif op == 0x15:
+				self.delay[km] = V[km, xm]
+				self.delay_t[km] = self.clock()
+			elif op == 0x18:
+				self.sound[km] = V[km, xm]
+				self.sound_t[km] = self.clock()
+				self.armed[km] = V[km, xm] > 0
+			elif op == 0x1e:
+				self.I[km] = (self.I[km] + V[km, xm]) & 0xfff
+			elif op == 0x29:
+				self.I[km] = V[km, xm] * 5
+			elif op == 0x30:
+				self.I[km] = bigfont_addr + V[km, xm] * 10
+			elif op == 0x33:
+				vx = V[km, xm]
+				for i, d in enumerate((vx // 100 % 10, vx // 10 % 10, vx % 10)):
+					self.store(km, self.I[km] + i, d)
+			elif op == 0x55:
+				for i in range(16):
+					r = xm >= i
+					self.store(km[r], self.I[km[r]] + i, V[km[r], i])
+			elif op == 0x65:
+				for i in range(16):
+					r = (xm >= i) & (self.I[km] + i < self.ram.shape[1])
+					V[km[r], i] = self.ram[km[r], self.I[km[r]] + i]
+			elif op == 0x75:
+				for i in range(16):
+					r = xm >= i
+					self.rpl[km[r], i] = V[km[r], i]
+			elif op == 0x85:
+				for i in range(16):
+					r = xm >= i
+					V[km[r], i] = self.rpl[km[r], i]
+
+	def store(self, k, addr, val):
+		# writes past the end of ram are dropped
+		m = addr < self.ram.shape[1]
+		self.ram[k[m], addr[m]] = val[m]
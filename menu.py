@@ -1,14 +1,20 @@
-import urllib.request
 import dialogs
 import console
 import time
 
 from emul.system import System
 from config import Config
+from romcache import RomCache, Connections, Loader
 
 class Menu:
 	def __init__(self, cfg):
 		self.cfg = cfg
+		self.conns = Connections(cfg.rom_dl_jobs)
+		self.cache = RomCache(cfg.rom_cache_dir, cfg.rom_cache_sz, cfg.rom_cache_age, cfg.rom_dl_timeout, self.conns.fetch)
+		self.loader = Loader(self.cache, cfg.rom_dl_jobs)
+		
+		# the list and its roms load while the ui comes up
+		self.titles = self.loader.list(cfg.rom_base_url, cfg.rom_list)
 	
 	def show(self):
 		opts = self.opt_rom() + self.opt_misc()
@@ -25,10 +31,11 @@ class Menu:
 		return True
 	
 	def opt_rom(self):
-		list = self.load_list(
-			self.cfg.rom_base_url + self.cfg.rom_list)
+		list = self.titles.result()
 			
 		if not list:
+			# try again the next time the menu is shown
+			self.titles = self.loader.list(self.cfg.rom_base_url, self.cfg.rom_list)
 			console.alert('Error', 'Cannot download ROM list', 'Ok', hide_cancel_button = True)
 			return []
 	
@@ -76,14 +83,5 @@ class Menu:
 			time.sleep(0.5)
 	
 	def load_rom(self, url):
-		try:
-			return bytearray(urllib.request.urlopen(url, timeout=self.cfg.rom_dl_timeout).read())
-		except:
-			return None
-		
-	def load_list(self, url):
-		try:
-			list = urllib.request.urlopen(url, timeout=self.cfg.rom_dl_timeout).readlines()
-			return [i.decode('utf-8').strip() for i in list]
-		except:
-			return None
+		data = self.loader.rom(url)
+		return bytearray(data) if data is not None else None
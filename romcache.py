@@ -0,0 +1,251 @@
+import hashlib
+import http.client
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+def urlfetch(url, headers, timeout):
+	# (status, headers, body); a 304 comes back as a status, not an error.
+	# header names are lowercased
+	req = urllib.request.Request(url, headers=headers)
+	try:
+		with urllib.request.urlopen(req, timeout=timeout) as res:
+			return res.status, lower(res.headers.items()), res.read()
+	except urllib.error.HTTPError as e:
+		if e.code == 304:
+			return 304, lower(e.headers.items()), b''
+		raise
+
+def lower(headers):
+	return {k.lower(): v for k, v in headers}
+
+class Connections:
+	# keep-alive http connections per host, at most size idle ones each;
+	# fetch has the same signature as urlfetch
+	def __init__(self, size=4):
+		self.size = size
+		self.idle = {}
+		self.lock = threading.Lock()
+
+	def fetch(self, url, headers, timeout):
+		u = urllib.parse.urlsplit(url)
+		key = (u.scheme, u.hostname, u.port)
+		path = u.path + ('?' + u.query if u.query else '')
+
+		# a pooled connection may have been closed by the server; retry
+		# once on a fresh one
+		for retry in (True, False):
+			conn = self.take(key, timeout)
+			fresh = conn.sock is None
+			try:
+				conn.request('GET', path or '/', headers=headers)
+				res = conn.getresponse()
+				body = res.read()
+			except (OSError, http.client.HTTPException) as e:
+				conn.close()
+				if retry and not fresh:
+					continue
+				raise OSError(e)
+
+			if res.will_close:
+				conn.close()
+			else:
+				self.give(key, conn)
+			return res.status, lower(res.getheaders()), body
+
+	def take(self, key, timeout):
+		with self.lock:
+			idle = self.idle.get(key)
+			if idle:
+				conn = idle.pop()
+				conn.timeout = timeout
+				return conn
+
+		scheme, host, port = key
+		cls = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+		return cls(host, port, timeout=timeout)
+
+	def give(self, key, conn):
+		with self.lock:
+			idle = self.idle.setdefault(key, [])
+			if len(idle) < self.size:
+				idle.append(conn)
+				return
+		conn.close()
+
+	def close(self):
+		with self.lock:
+			for idle in self.idle.values():
+				for conn in idle:
+					conn.close()
+			self.idle = {}
+
+class Loader:
+	# fetches the rom list in the background and prefetches every listed
+	# rom with at most jobs requests in flight, so roms start from memory
+	def __init__(self, cache, jobs=4):
+		self.cache = cache
+		self.pool = ThreadPoolExecutor(jobs)
+		self.roms = {}
+		self.lock = threading.Lock()
+
+	def list(self, base, name):
+		# future of the titles in the list at base + name
+		def load():
+			data = self.cache.get(base + name)
+			if data is None:
+				return None
+			titles = [i.strip() for i in data.decode('utf-8').splitlines() if i.strip()]
+			for title in titles:
+				self.prefetch(base + title)
+			return titles
+		return self.pool.submit(load)
+
+	def prefetch(self, url):
+		with self.lock:
+			if url not in self.roms:
+				self.roms[url] = self.pool.submit(self.cache.get, url)
+			return self.roms[url]
+
+	def rom(self, url):
+		# blocks only if the rom is not in memory yet; failed fetches are
+		# retried on the next call
+		data = self.prefetch(url).result()
+		if data is None:
+			with self.lock:
+				self.roms.pop(url, None)
+		return data
+
+	def close(self):
+		self.pool.shutdown(wait=False)
+
+class RomCache:
+	# downloads kept on disk by content hash, with an index from url to
+	# hash and validators. entries younger than age are served without a
+	# request, older ones are revalidated, and anything cached is served
+	# when the server can't be reached. the least recently used entries
+	# are evicted once the blobs exceed size bytes
+	def __init__(self, path, size=1 << 20, age=3600, timeout=3, fetch=urlfetch):
+		self.path = path
+		self.size = size
+		self.age = age
+		self.timeout = timeout
+		self.fetch = fetch
+		self.lock = threading.Lock()
+
+		os.makedirs(os.path.join(path, 'blobs'), exist_ok=True)
+		self.index_path = os.path.join(path, 'index.json')
+		try:
+			with open(self.index_path) as f:
+				self.index = json.load(f)
+		except (OSError, ValueError):
+			self.index = {}
+		self.tick = max([e['used'] for e in self.index.values()] + [0])
+
+	def blob(self, digest):
+		return os.path.join(self.path, 'blobs', digest)
+
+	def read(self, url):
+		# cached content of url, or None if missing or corrupted
+		entry = self.index.get(url)
+		if not entry:
+			return None
+		try:
+			with open(self.blob(entry['hash']), 'rb') as f:
+				data = f.read()
+		except OSError:
+			data = None
+		if data is None or hashlib.sha1(data).hexdigest() != entry['hash']:
+			del self.index[url]
+			return None
+		return data
+
+	def get(self, url):
+		with self.lock:
+			data = self.read(url)
+			entry = self.index.get(url)
+			if data is not None and time.time() - entry['fetched'] < self.age:
+				self.touch(url)
+				return data
+
+			headers = {}
+			if data is not None:
+				if entry.get('etag'):
+					headers['If-None-Match'] = entry['etag']
+				if entry.get('modified'):
+					headers['If-Modified-Since'] = entry['modified']
+
+		try:
+			status, res, body = self.fetch(url, headers, self.timeout)
+		except OSError:
+			status = None
+
+		with self.lock:
+			if status == 200:
+				self.store(url, body, res)
+				return body
+			if status == 304 and data is not None and url in self.index:
+				self.index[url]['fetched'] = time.time()
+				self.touch(url)
+				return data
+			# offline or failed; whatever is cached will do
+			return data
+
+	def touch(self, url):
+		self.tick += 1
+		self.index[url]['used'] = self.tick
+		self.save()
+
+	def store(self, url, body, headers):
+		digest = hashlib.sha1(body).hexdigest()
+		if not os.path.exists(self.blob(digest)):
+			tmp = self.blob(digest) + '.tmp'
+			with open(tmp, 'wb') as f:
+				f.write(body)
+			os.replace(tmp, self.blob(digest))
+
+		old = self.index.get(url)
+		self.index[url] = {
+			'hash'    : digest,
+			'size'    : len(body),
+			'etag'    : headers.get('etag'),
+			'modified': headers.get('last-modified'),
+			'fetched' : time.time(),
+			'used'    : 0,
+		}
+		if old and old['hash'] != digest:
+			self.drop(old['hash'])
+		self.touch(url)
+		self.evict()
+
+	def total(self):
+		# bytes held by blobs; urls with the same content share one
+		return sum({e['hash']: e['size'] for e in self.index.values()}.values())
+
+	def evict(self):
+		for url in sorted(self.index, key=lambda u: self.index[u]['used']):
+			if self.total() <= self.size:
+				break
+			digest = self.index.pop(url)['hash']
+			self.drop(digest)
+		self.save()
+
+	def drop(self, digest):
+		# remove a blob no entry refers to anymore
+		if any(e['hash'] == digest for e in self.index.values()):
+			return
+		try:
+			os.remove(self.blob(digest))
+		except OSError:
+			pass
+
+	def save(self):
+		tmp = self.index_path + '.tmp'
+		with open(tmp, 'w') as f:
+			json.dump(self.index, f)
+		os.replace(tmp, self.index_path)
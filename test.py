@@ -1,12 +1,23 @@
 import unittest
 import logging
+import os
+import tempfile
+import json
+import threading
 
 from emul.cpu import *
 from emul.keyboard import *
 from emul.graphics import *
 from emul.timer import *
-from emul.audio import *
+from emul.headless import *
 from emul.ram import *
+from emul.system import *
+
+try:
+	import numpy
+	from emul.vector import VectorCPU
+except ImportError:
+	numpy = None
 
 class CpuTest(unittest.TestCase):
 	def setUp(self):
@@ -16,11 +27,11 @@ class CpuTest(unittest.TestCase):
 		
 		self.kbd = Keyboard()
 		
-		self.audio = Audio()
-		self.gfx = Graphics(self.kbd)
+		self.backend = Headless()
+		self.gfx = Graphics()
 		
 		self.ram = Ram()
-		self.cpu = CPU(ram=self.ram, kbd=self.kbd, gfx=self.gfx, audio=self.audio)
+		self.cpu = CPU(ram=self.ram, kbd=self.kbd, gfx=self.gfx, backend=self.backend)
 		
 	def test_dec(self):
 		self.assertEqual(dec1(0x1234), 0x4)
@@ -30,6 +41,64 @@ class CpuTest(unittest.TestCase):
 		self.assertEqual(decl(0x1234), 0x34)
 		self.assertEqual(deca(0x1234), 0x234)
 	
+	def test_icache(self):
+		self.cpu.ram[0x300:0x302] = bytes([0x61, 0x05])
+		self.cpu.pc = 0x300
+		ins = self.cpu.fetch()
+		self.assertEqual(ins.code, 0x6105)
+		self.assertEqual((ins.x, ins.kk), (1, 0x05))
+		self.assertIs(self.cpu.fetch(), ins)
+		
+		# FX33 overwriting the cached instruction invalidates it
+		self.cpu.V[2] = 100
+		self.cpu.I = 0x2ff
+		self.cpu.exe(0xf233)
+		self.assertEqual(self.cpu.fetch().code, 0x0000)
+	
+	def test_steps(self):
+		self.cpu.ram[0x300:0x304] = bytes([0x71, 0x01, 0x13, 0x00])
+		self.cpu.pc = 0x300
+		self.cpu.steps(10)
+		self.assertEqual(self.cpu.cycles, 10)
+		self.assertEqual(self.cpu.V[1], 5)
+		self.assertEqual(self.cpu.pc, 0x300)
+	
+	def test_op_sprite(self):
+		# digit 0 from the font at (2, 3)
+		self.cpu.I = 0
+		self.cpu.V[1] = 2
+		self.cpu.V[2] = 3
+		self.cpu.exe(0xd125)
+		self.assertEqual(self.cpu.V[0xf], 0)
+		self.assertTrue(self.gfx.get(2, 3))
+		self.assertFalse(self.gfx.get(3, 4))
+		self.assertTrue(self.gfx.get(5, 7))
+		self.cpu.exe(0xd125)
+		self.assertEqual(self.cpu.V[0xf], 1)
+		self.assertFalse(self.gfx.get(2, 3))
+	
+	def test_schip(self):
+		# large digit 8 drawn in extended mode
+		self.cpu.exe(0x00fe)
+		self.assertTrue(self.gfx.extended)
+		self.cpu.V[0] = 8
+		self.cpu.exe(0xf030)
+		self.assertEqual(self.cpu.I, 0x50 + 80)
+		self.assertEqual(self.cpu.ram[self.cpu.I], 0x3c)
+		self.cpu.V[1] = 100
+		self.cpu.V[2] = 50
+		self.cpu.exe(0xd12a)
+		self.assertTrue(self.gfx.get(102, 50))
+		self.assertFalse(self.gfx.get(101, 50))
+		self.cpu.exe(0x00c2)
+		self.assertTrue(self.gfx.get(102, 52))
+		
+		# 00FD stays put and powers off
+		self.cpu.pc = 0x302
+		self.cpu.exe(0x00fd)
+		self.assertEqual(self.cpu.pc, 0x300)
+		self.assertFalse(self.cpu.power_on())
+	
 	def test_op_call(self):
 		self.cpu.pc = 0x2a0
 		self.cpu.sp = 0
@@ -44,6 +113,41 @@ class CpuTest(unittest.TestCase):
 		self.assertEqual(self.cpu.pc, 0x2a0)
 		self.assertEqual(self.cpu.sp, 0)
 		
+	def test_stack_underflow(self):
+		self.cpu.pc = 0x302
+		with self.assertRaises(StackUnderflow) as e:
+			self.cpu.exe(0x00ee)
+		self.assertEqual((e.exception.pc, e.exception.code), (0x300, 0x00ee))
+	
+	def test_clip_to_ram(self):
+		self.cpu.V[0] = 235
+		self.cpu.I = 0xffe
+		self.cpu.exe(0xf033)
+		self.assertEqual(self.cpu.ram[0xffe:], bytes([2, 3]))
+		self.assertEqual(len(self.cpu.ram), 4096)
+		
+		# I past the end of a smaller ram
+		cpu = CPU(ram=Ram(0x800), kbd=self.kbd, gfx=self.gfx, backend=self.backend)
+		cpu.I = 0xfff
+		for code in (0xf033, 0xff55, 0xff65):
+			cpu.exe(code)
+		self.assertEqual(len(cpu.ram), 0x800)
+	
+	def test_pc_overflow(self):
+		self.cpu.pc = 0xfff
+		with self.assertRaises(PcOverflow) as e:
+			self.cpu.steps(1)
+		self.assertEqual(e.exception.pc, 0xfff)
+		self.cpu.pc = 0x1000
+		with self.assertRaises(PcOverflow):
+			self.cpu.steps(1)
+	
+	def test_mop_add_index(self):
+		self.cpu.I = 0xffe
+		self.cpu.V[3] = 5
+		self.cpu.exe(0xf31e)
+		self.assertEqual(self.cpu.I, 0x003)
+	
 	def test_op_add(self):
 		# 3 + 0xff = 1
 		self.cpu.V[1] = 3
@@ -162,10 +266,10 @@ class CpuTest(unittest.TestCase):
 				self.assertEqual(self.cpu.V[i], 39)
 		
 	def test_mop_store_bcd(self):
-		self.cpu.V[6] = 935
+		self.cpu.V[6] = 235
 		self.cpu.I = 0x780
 		self.cpu.exe(0xf633)
-		self.assertEqual(self.cpu.ram[0x780], 9)
+		self.assertEqual(self.cpu.ram[0x780], 2)
 		self.assertEqual(self.cpu.ram[0x781], 3)
 		self.assertEqual(self.cpu.ram[0x782], 5)
 	
@@ -180,5 +284,1092 @@ class CpuTest(unittest.TestCase):
 		self.cpu.exe(0xb122)
 		self.assertEqual(self.cpu.pc, 0x122 + 29)
 	
+class TimerTest(unittest.TestCase):
+	def setUp(self):
+		self.now = 0.0
+		self.beeps = 0
+	
+	def clock(self):
+		return self.now
+	
+	def beep(self):
+		self.beeps += 1
+	
+	def test_get(self):
+		t = Timer(freq=60, clock=self.clock)
+		self.assertEqual(t.get(), 0)
+		t.set(10)
+		self.now = 5 / 60
+		self.assertEqual(t.get(), 5)
+		self.now = 1.0
+		self.assertEqual(t.get(), 0)
+	
+	def test_poll(self):
+		t = Timer(freq=60, event=self.beep, clock=self.clock)
+		t.set(2)
+		t.poll()
+		self.assertEqual(self.beeps, 0)
+		self.now = 2 / 60
+		t.poll()
+		t.poll()
+		self.assertEqual(self.beeps, 1)
+	
+	def test_deterministic(self):
+		sys = System(backend=Headless(), cpu_deterministic=True, cpu_throttle=False)
+		sys.start(bytes([0x60, 0x0a, 0xf0, 0x15, 0x12, 0x04]), 10 * 3)
+		self.assertEqual(sys.cpu.delay_timer.get(), 7)
+	
+	def test_frame_remainder(self):
+		# 1000 instructions per second don't divide into 60 frames
+		sys = System(backend=Headless(), cpu_deterministic=True, cpu_throttle=False, cpu_ips=1000)
+		batches = []
+		sys.cpu.frame_hooks.append(lambda cpu: batches.append(cpu.cycles))
+		sys.start(bytes([0x60, 0x3c, 0xf0, 0x15, 0x12, 0x04]), 1000)
+		self.assertEqual(sys.cpu.frames, 60)
+		self.assertEqual(batches[:3], [16, 33, 50])
+		self.assertEqual(sys.cpu.delay_timer.get(), 0)
+	
+class KeyboardTest(unittest.TestCase):
+	def setUp(self):
+		self.kbd = Keyboard()
+	
+	def test_keys(self):
+		self.kbd.set(0xa, True)
+		self.kbd.set(0x3, True)
+		self.assertEqual(self.kbd.keys, 1 << 0xa | 1 << 0x3)
+		self.assertTrue(self.kbd.peek(0xa))
+		self.assertTrue(self.kbd.pressed(self.kbd.map.index(0x3)))
+		self.assertFalse(self.kbd.peek(0x5))
+		self.kbd.set(0xa, False)
+		self.assertFalse(self.kbd.peek(0xa))
+		self.kbd.release()
+		self.assertEqual(self.kbd.keys, 0)
+	
+	def test_wait(self):
+		t = threading.Timer(0.05, self.kbd.press, [self.kbd.map.index(0xb)])
+		t.start()
+		self.assertEqual(self.kbd.wait(), 0xb)
+		t.join()
+	
+	def test_wait_shutdown(self):
+		t = threading.Timer(0.05, self.kbd.press, ['shutdown'])
+		t.start()
+		self.assertEqual(self.kbd.wait(), 0)
+		t.join()
+	
+class IdleTest(unittest.TestCase):
+	# wait for DT in a polling loop, then halt
+	rom = bytes([0x60, 0x05, 0xf0, 0x15, 0xf1, 0x07, 0x31, 0x00, 0x12, 0x04, 0x12, 0x0a])
+	
+	def run_rom(self, **kwargs):
+		sys = System(backend=Headless(), cpu_deterministic=True, cpu_throttle=False, **kwargs)
+		# frame the loop was left in
+		self.left = None
+		sys.cpu.frame_hooks.append(self.hook)
+		sys.start(self.rom, 100)
+		return sys.cpu
+	
+	def hook(self, cpu):
+		if self.left is None and cpu.pc == 0x20a:
+			self.left = cpu.frames
+	
+	def test_skip(self):
+		for jit in (False, True):
+			cpu = self.run_rom(cpu_jit=jit)
+			self.assertEqual(cpu.idle, {0x208: 0x204, 0x20a: 0x20a})
+			self.assertEqual(cpu.pc, 0x20a)
+			self.assertEqual(cpu.cycles, 100)
+			self.assertGreater(cpu.skipped, 50)
+			self.assertEqual(self.left, 6)
+	
+	def test_no_skip(self):
+		cpu = self.run_rom(cpu_idle_skip=False)
+		self.assertEqual(cpu.idle, {})
+		self.assertEqual(cpu.skipped, 0)
+		self.assertEqual(cpu.pc, 0x20a)
+		self.assertEqual(self.left, 6)
+	
+	def test_jump_out(self):
+		# the loop at 0202 jumps out to code that counts in V1
+		rom = bytearray(0x104)
+		rom[0x000:0x004] = bytes([0x13, 0x00, 0x12, 0x00])
+		rom[0x100:0x104] = bytes([0x71, 0x01, 0x12, 0x02])
+		for analyze in (False, True):
+			for skip in (False, True):
+				sys = System(backend=Headless(), cpu_throttle=False, cpu_analyze=analyze, cpu_idle_skip=skip)
+				sys.start(bytes(rom), 1000)
+				self.assertEqual(sys.cpu.idle, {})
+				self.assertEqual(sys.cpu.V[1], 250)
+	
+	def test_invalidate(self):
+		cpu = self.run_rom()
+		# a store into the loop body turns the jump back into a plain one
+		cpu.ram[0x206] = 0x71
+		self.assertNotIn(0x208, cpu.idle)
+		self.assertIsNone(cpu.icache[0x208])
+		self.assertIn(0x20a, cpu.idle)
+	
+class TraceTest(unittest.TestCase):
+	def test_disasm(self):
+		from emul.disasm import disasm
+		self.assertEqual(disasm(0x2230), 'CALL 0230')
+		self.assertEqual(disasm(0x8154), 'ADD V1, V5')
+		self.assertEqual(disasm(0xf633), 'LD B, V6')
+		self.assertEqual(disasm(0xf099), '???')
+	
+	def test_ring(self):
+		sys = System(backend=Headless(), cpu_trace=True, cpu_trace_sz=4)
+		sys.load(bytes([0x71, 0x01, 0x12, 0x00]))
+		sys.cpu.pc = 0x200
+		sys.cpu.steps(7)
+		entries = list(sys.cpu.tracer.entries())
+		self.assertEqual([(pc, code) for pc, code, _, _ in entries],
+			[(0x202, 0x1200), (0x200, 0x7101), (0x202, 0x1200), (0x200, 0x7101)])
+		self.assertEqual(entries[-1][3][1], 3)
+	
+	def test_file(self):
+		with tempfile.TemporaryDirectory() as d:
+			path = os.path.join(d, 'trace.txt')
+			sys = System(backend=Headless(), cpu_trace=True, cpu_trace_file=path, cpu_trace_sz=4, cpu_throttle=False)
+			sys.start(bytes([0x71, 0x01, 0x12, 0x00]), 10)
+			sys.cpu.tracer.close()
+			with open(path) as f:
+				lines = f.read().splitlines()
+		self.assertEqual(len(lines), 10)
+		self.assertTrue(lines[0].startswith('0200    7101: ADD V1, 0001'))
+	
+class AnalysisTest(unittest.TestCase):
+	# a call to a sprite routine, a skip, a halt loop and sprite data
+	rom = bytes([
+		0x22, 0x08, 0x30, 0x00, 0x12, 0x04, 0x12, 0x00,
+		0xa2, 0x0e, 0xd0, 0x15, 0x00, 0xee,
+		0xf0, 0x90, 0xf0, 0x90, 0xf0,
+	])
+	
+	def test_blocks(self):
+		from emul.disasm import Analysis
+		a = Analysis(self.rom)
+		self.assertEqual(sorted(a.blocks.values()), [
+			(0x200, 0x202, [0x202], [0x208]),
+			(0x202, 0x204, [0x204, 0x206], []),
+			(0x204, 0x206, [0x204], []),
+			(0x206, 0x208, [0x200], []),
+			(0x208, 0x20e, [], []),
+		])
+		self.assertEqual(a.routines, {0x200: [0x208], 0x208: []})
+		self.assertEqual(a.regions(), [(0x200, 0x20e, 'code'), (0x20e, 0x213, 'data')])
+		
+		text = a.text()
+		self.assertIn('sub_0208:', text)
+		self.assertIn('020a    d015: DRW V0, V1, 0005', text)
+		self.assertIn('020e    DB f0, 90, f0, 90, f0', text)
+		self.assertEqual(json.loads(a.json())['routines'], {'0200': ['0208'], '0208': []})
+		self.assertIn('b0200 -> b0208 [style=dashed];', a.dot())
+	
+	def test_seed(self):
+		from emul.disasm import analyze
+		self.assertIs(analyze(self.rom), analyze(bytes(self.rom)))
+		for jit in (False, True):
+			sys = System(backend=Headless(), cpu_jit=jit)
+			sys.load(self.rom)
+			cpu = sys.cpu
+			self.assertEqual([a for a in range(0x200, 0x213) if cpu.icache[a]], list(range(0x200, 0x20e, 2)))
+			self.assertEqual(cpu.idle, {0x204: 0x204})
+			if jit:
+				self.assertEqual(sorted(cpu.jit.blocks), [0x200, 0x202, 0x204, 0x206, 0x208])
+	
+class CoverageTest(unittest.TestCase):
+	# a taken and a not taken skip, a carry, then an unknown opcode
+	rom = bytes([0x60, 0x05, 0x30, 0x05, 0x61, 0x00, 0x30, 0x06, 0x61, 0xff, 0x80, 0x14, 0xf0, 0x99])
+	
+	def test_report(self):
+		sys = System(backend=Headless(), cpu_throttle=False, cpu_coverage=True)
+		with self.assertRaises(UnknownOpcode):
+			sys.start(self.rom, 100)
+		rep = sys.cpu.coverage.report()
+		
+		self.assertEqual(rep['instructions'], 5)
+		self.assertEqual(rep['handlers'], {'op_move': 2, 'op_skip_eq_val': 2, 'lop_add': 1})
+		self.assertEqual(rep['branches'], {
+			'op_skip_eq_val': {'not_taken': 1, 'taken': 1},
+			'lop_add': {'vf0': 0, 'vf1': 1},
+		})
+		self.assertEqual(rep['pcs'], 5)
+		self.assertEqual(rep['fault'], {'pc': '020c', 'code': 'f099', 'error': 'UnknownOpcode'})
+	
+	def test_matrix(self):
+		from emul.coverage import matrix
+		sys = System(backend=Headless(), cpu_throttle=False, cpu_coverage=True)
+		sys.start(self.rom[:12], 100)
+		head, rows = matrix([('ok', sys.cpu.coverage.report())])
+		row = dict(zip(head, rows[0]))
+		self.assertEqual(row['rom'], 'ok')
+		self.assertEqual(row['fault'], '')
+		self.assertEqual(row['lop_add:vf1'], 1)
+		self.assertEqual(row['op_skip_eq_val:taken'], 1)
+		self.assertEqual(row['mop_keyd'], 0)
+	
+class ProfileTest(unittest.TestCase):
+	# call a routine in a loop
+	rom = bytes([0x22, 0x06, 0x71, 0x01, 0x12, 0x00, 0x70, 0x01, 0x00, 0xee])
+	
+	def test_profile(self):
+		with tempfile.TemporaryDirectory() as d:
+			path = os.path.join(d, 'profile.json')
+			sys = System(backend=Headless(), cpu_throttle=False, cpu_profile=True, cpu_profile_file=path, cpu_jit=True)
+			self.assertIsNone(sys.cpu.jit)
+			sys.start(self.rom, 50)
+			
+			with open(path) as f:
+				rep = json.load(f)
+			with open(path + '.folded') as f:
+				folded = f.read().splitlines()
+		
+		self.assertEqual(rep['instructions'], 50)
+		self.assertEqual({k: v['count'] for k, v in rep['handlers'].items()},
+			{'op_call': 10, 'op_add': 20, 'op_jump': 10, 'rop_ret': 10})
+		self.assertEqual({k: v['count'] for k, v in rep['blocks'].items()},
+			{'0200': 10, '0206': 10, '0202': 10})
+		self.assertEqual(rep['pcs']['0206']['op'], 'ADD V0, 0001')
+		self.assertEqual(rep['frames']['count'], 5)
+		self.assertEqual(rep['frames']['ipf_mean'], 10)
+		self.assertEqual(sorted(l.rsplit(' ', 1)[0] for l in folded),
+			['0200;0206;op_add', '0200;0206;rop_ret', '0200;op_add', '0200;op_call', '0200;op_jump'])
+	
+class GraphicsTest(unittest.TestCase):
+	def setUp(self):
+		self.gfx = Graphics()
+	
+	def test_set_get(self):
+		self.gfx.set(0, 0, True)
+		self.gfx.set(63, 31, True)
+		self.assertTrue(self.gfx.get(0, 0))
+		self.assertTrue(self.gfx.get(63, 31))
+		self.assertFalse(self.gfx.get(1, 0))
+		self.assertEqual(self.gfx.map[0], 1 << 63)
+		self.gfx.set(0, 0, False)
+		self.assertFalse(self.gfx.get(0, 0))
+	
+	def test_blit_wrap(self):
+		# 8-wide row straddling the right edge
+		self.assertFalse(self.gfx.blit(60, 31, [0xff, 0x81], 8))
+		self.assertEqual(self.gfx.map[31], 0xf00000000000000f)
+		self.assertEqual(self.gfx.map[0], 0x1000000000000008)
+		
+		# drawing it again erases it and reports the collision
+		self.assertTrue(self.gfx.blit(60, 31, [0xff, 0x81], 8))
+		self.assertEqual(self.gfx.map, [0] * 32)
+	
+	def test_blit_wide(self):
+		self.assertFalse(self.gfx.blit(56, 0, [0xabcd], 16))
+		self.assertEqual(self.gfx.map[0], 0xcd000000000000ab)
+	
+	def test_dirty(self):
+		self.assertTrue(all(self.gfx.dirty))
+		self.gfx.dirty = [False] * 32
+		self.gfx.blit(0, 30, [0x80, 0x00, 0x80], 8)
+		self.assertEqual([y for y in range(32) if self.gfx.dirty[y]], [0, 30])
+		self.gfx.clear()
+		self.assertTrue(all(self.gfx.dirty))
+	
+	def test_extend(self):
+		self.gfx.set(0, 0, True)
+		self.gfx.extend(True)
+		self.assertEqual((self.gfx.width, self.gfx.height), (128, 64))
+		self.assertEqual(self.gfx.map, [0] * 64)
+		self.gfx.blit(124, 63, [0xff], 8)
+		self.assertEqual(self.gfx.map[63], 0xf << 124 | 0xf)
+		self.gfx.extend(False)
+		self.assertEqual((self.gfx.width, self.gfx.height), (64, 32))
+	
+	def test_scroll(self):
+		self.gfx.blit(8, 0, [0xff], 8)
+		self.gfx.dirty = [False] * 32
+		self.gfx.down(3)
+		self.assertEqual(self.gfx.map[0], 0)
+		self.assertEqual(self.gfx.map[3], 0xff << 48)
+		self.assertTrue(all(self.gfx.dirty))
+		self.gfx.right()
+		self.assertEqual(self.gfx.map[3], 0xff << 44)
+		self.gfx.left()
+		self.gfx.left()
+		self.gfx.left()
+		self.assertEqual(self.gfx.map[3], 0xff << 56)
+		self.gfx.left()
+		self.assertEqual(self.gfx.map[3], 0xf << 60)
+	
+	def test_runs(self):
+		self.gfx.blit(0, 0, [0xe7], 8)
+		self.gfx.blit(60, 0, [0xf0], 8)
+		self.assertEqual(self.gfx.runs(0), [(0, 3), (5, 3), (60, 4)])
+		self.assertEqual(self.gfx.runs(1), [])
+	
+class JitTest(unittest.TestCase):
+	prog = [
+		0x6005, 0x6100, 0x7101, 0x8014, 0x8215, 0x8300, 0x830e, 0xa400,
+		0xf033, 0xf255, 0x2220, 0x3164, 0x1204, 0x121a, 0x0000, 0x0000,
+		0x8416, 0x8417, 0x00ee,
+	]
+	
+	def setUp(self):
+		self.cpus = []
+		for jit in (False, True):
+			kbd = Keyboard()
+			ram = Ram()
+			for i, code in enumerate(self.prog):
+				ram[0x200 + i * 2:0x202 + i * 2] = code.to_bytes(2, 'big')
+			cpu = CPU(ram=ram, kbd=kbd, gfx=Graphics(), backend=Headless(), cpu_jit=jit)
+			cpu.pc = 0x200
+			self.cpus.append(cpu)
+	
+	def test_jit_matches_interpreter(self):
+		interp, jit = self.cpus
+		while interp.pc != 0x21a:
+			interp.steps(1)
+		while jit.pc != 0x21a:
+			jit.jit.exe()
+		self.assertEqual(interp.V, jit.V)
+		self.assertEqual(interp.I, jit.I)
+		self.assertEqual(interp.sp, jit.sp)
+		self.assertEqual(interp.ram, jit.ram)
+	
+	def test_jit_timers(self):
+		# a short block, then one longer than the batch that sets and
+		# reads DT in the interpreted tail
+		rom = bytes([0x70, 0x01, 0x12, 0x04, 0xf0, 0x15, 0xf1, 0x07] + [0x70, 0x01] * 25 + [0x12, 0x00])
+		timers = []
+		for jit in (False, True):
+			sys = System(backend=Headless(), cpu_throttle=False, cpu_deterministic=True, cpu_ips=1200, cpu_jit=jit)
+			dt = sys.cpu.delay_timer
+			seen = []
+			sys.cpu.frame_hooks.append(lambda cpu: seen.append((dt.t, dt.c, cpu.V[1])))
+			sys.start(rom, 2000)
+			timers.append(seen)
+		self.assertEqual(timers[0], timers[1])
+	
+	def test_jit_fault_cycles(self):
+		import batch
+		# recurse until the stack overflows at 0204
+		rom = bytes([0x70, 0x01, 0x70, 0x01, 0x22, 0x00])
+		recs = [batch.run('deep', rom, 1000, {'cpu_throttle': False, 'cpu_jit': jit}) for jit in (False, True)]
+		self.assertEqual([r['cycles'] for r in recs], [74, 74])
+		self.assertEqual(recs[0]['fault'], recs[1]['fault'])
+	
+	def test_jit_invalidate(self):
+		jit = self.cpus[1]
+		jit.jit.exe()
+		self.assertEqual(jit.V[0], 6)
+		self.assertIn(0x200, jit.jit.blocks)
+		
+		# patching the block drops it
+		jit.ram[0x201] = 0x07
+		self.assertNotIn(0x200, jit.jit.blocks)
+		jit.pc = 0x200
+		jit.jit.exe()
+		self.assertEqual(jit.V[0], 8)
+	
+	def test_jit_budget(self):
+		# a 64 instruction loop runs the per frame budget, not whole blocks
+		rom = bytes([0x70, 0x01] * 63 + [0x12, 0x00])
+		sys = System(backend=Headless(), cpu_throttle=False, cpu_jit=True)
+		sys.load(rom)
+		sys.cpu.run(0x200, 6000)
+		self.assertEqual(sys.cpu.cycles, 6000)
+		self.assertEqual(sys.cpu.frames, 600)
+		self.assertEqual(sys.cpu.V[0], (6000 // 64 * 63 + 6000 % 64) & 0xff)
+		
+		sys.cpu.run(0x200, 5)
+		self.assertEqual(sys.cpu.cycles, 6005)
+	
+class HeadlessTest(unittest.TestCase):
+	def test_start(self):
+		# draw digit 0, beep, then spin
+		rom = bytes([
+			0xa0, 0x00, 0xd0, 0x05, 0x60, 0x02, 0xf0, 0x18, 0x12, 0x08,
+		])
+		backend = Headless(script=[(5, 'shutdown', True)])
+		with System(backend=backend, cpu_ips=6000, cpu_deterministic=True) as sys:
+			sys.start(rom)
+			self.assertEqual(sys.cpu.frames, 5)
+			self.assertEqual(sys.gfx.map[0], 0xf << 60)
+		self.assertEqual(backend.events[0], (0, 'boot'))
+		self.assertIn((2, 'beep'), backend.events)
+		self.assertEqual(backend.events[-1], (5, 'shutdown'))
+	
+	def test_input(self):
+		backend = Headless(script=[(1, 0xa, True), (2, 0xa, False)])
+		sys = System(backend=backend)
+		backend.show(sys.gfx, sys.kbd)
+		sys.cpu.frame()
+		self.assertTrue(sys.kbd.peek(0xa))
+		sys.cpu.frame()
+		self.assertFalse(sys.kbd.peek(0xa))
+	
+	def test_release_one(self):
+		backend = Headless(script=[(1, 5, True), (1, 6, True), (2, 5, False)])
+		sys = System(backend=backend)
+		backend.show(sys.gfx, sys.kbd)
+		sys.cpu.frame()
+		sys.cpu.frame()
+		self.assertFalse(sys.kbd.peek(5))
+		self.assertTrue(sys.kbd.peek(6))
+	
+	def test_key_wait(self):
+		# wait for a key into V0, then spin
+		rom = bytes([0xf0, 0x0a, 0x12, 0x02])
+		backend = Headless(script=[(3, 0x5, True)])
+		sys = System(backend=backend, cpu_throttle=False)
+		sys.start(rom, 100)
+		self.assertEqual(sys.cpu.V[0], 5)
+		self.assertEqual(sys.cpu.cycles, 100)
+		
+		# nothing left to press ends the run on the wait
+		backend = Headless()
+		sys = System(backend=backend, cpu_throttle=False)
+		sys.start(rom, 100)
+		self.assertEqual(sys.cpu.pc, 0x200)
+		self.assertEqual(sys.cpu.frames, 1)
+		self.assertIn((0, 'keywait'), backend.events)
+	
+@unittest.skipIf(numpy is None, 'numpy is not installed')
+class VectorTest(unittest.TestCase):
+	prog = [
+		0xa300, 0x6105, 0x8400, 0x8014, 0x8205, 0x8307, 0x8406, 0x840e,
+		0x8f14, 0x8f06, 0x3005, 0x7107, 0x5120, 0x9130, 0xf033, 0xf255,
+		0xa300, 0xf365, 0x2240, 0xd015, 0x7a01, 0x3a20, 0x1206, 0x2200,
+		0x0000, 0x0000, 0x0000, 0x0000, 0x0000, 0x0000, 0x0000, 0x0000,
+		0xf175, 0x8e14, 0xf185, 0x0000, 0x0000, 0x0000, 0x0000, 0x0000,
+		0x00ee,
+	]
+	
+	def rom(self):
+		return b''.join(c.to_bytes(2, 'big') for c in self.prog)
+	
+	def check(self, vec, i, cpu):
+		self.assertEqual(list(vec.V[i]), list(cpu.V))
+		self.assertEqual(vec.I[i], cpu.I)
+		self.assertEqual(vec.pc[i], cpu.pc)
+		self.assertEqual(vec.sp[i], cpu.sp)
+		self.assertEqual(bytes(vec.ram[i].astype('uint8')), bytes(cpu.ram))
+		for y in range(32):
+			row = int(''.join('1' if p else '0' for p in vec.fb[i, y]), 2)
+			self.assertEqual(row, cpu.gfx.map[y])
+	
+	def test_matches_cpu(self):
+		seeds = [0, 1, 5, 0x7f, 0x80, 0xfa, 0xff, 33]
+		vec = VectorCPU(len(seeds))
+		vec.load(self.rom())
+		vec.V[:, 0] = seeds
+		
+		cpus = []
+		for seed in seeds:
+			sys = System(backend=Headless())
+			sys.load(self.rom())
+			sys.cpu.pc = 0x200
+			sys.cpu.V[0] = seed
+			cpus.append(sys.cpu)
+		
+		for _ in range(600):
+			vec.step()
+			for i, cpu in enumerate(cpus):
+				if vec.halted[i]:
+					continue
+				cpu.steps(1)
+		
+		for i, cpu in enumerate(cpus):
+			self.check(vec, i, cpu)
+	
+	def test_faults(self):
+		vec = VectorCPU(2)
+		vec.load(bytes([0x22, 0x00]))
+		vec.ram[1, 0x200:0x202] = [0xf0, 0x99]
+		vec.run(30)
+		self.assertTrue(vec.halted.all())
+		self.assertEqual(list(vec.fault_code), [0x2200, 0xf099])
+		self.assertEqual(list(vec.fault_pc), [0x200, 0x200])
+		self.assertEqual(vec.sp[0], 24)
+	
+	def test_keys_and_timers(self):
+		# wait for a key, load it into DT and count down
+		vec = VectorCPU(2, cpu_ips=60)
+		vec.load(bytes([0xf3, 0x0a, 0xf3, 0x15, 0xf4, 0x07, 0x12, 0x04]))
+		vec.keys[1, 0x9] = True
+		vec.run(3)
+		self.assertEqual(list(vec.pc), [0x200, 0x206])
+		self.assertEqual(vec.timers()[0][1], 7)
+		self.assertEqual(vec.V[1, 4], 8)
+	
+	def test_frame_remainder(self):
+		vec = VectorCPU(1, cpu_ips=1000)
+		vec.load(bytes([0x12, 0x00]))
+		vec.run(1000)
+		self.assertEqual(vec.frames, 60)
+	
+	def lockstep(self, rom, seeds, cycles, keys=0):
+		# vector and scalar runs of rom from the same seeds and keys
+		vec = VectorCPU(len(seeds), seeds, cpu_ips=120)
+		vec.load(rom)
+		for key in range(16):
+			vec.keys[:, key] = keys >> key & 1
+		vec.run(cycles)
+		
+		cpus = []
+		for seed in seeds:
+			backend = Headless()
+			sys = System(backend=backend, cpu_ips=120, cpu_throttle=False, cpu_deterministic=True,
+				cpu_seed=seed, cpu_idle_skip=False)
+			sys.kbd.keys = keys
+			sys.load(rom)
+			sys.cpu.run(0x200, cycles)
+			cpus.append((sys.cpu, backend))
+		
+		for i, (cpu, backend) in enumerate(cpus):
+			self.check(vec, i, cpu)
+		return vec, cpus
+	
+	def test_rand_matches_cpu(self):
+		# random bytes stored one after another
+		rom = bytes([0xa3, 0x00, 0xc0, 0xff, 0xc1, 0x3c, 0xf1, 0x55, 0xf1, 0x1e, 0x12, 0x02])
+		self.lockstep(rom, [0, 1, 42, 0xdeadbeef], 600)
+	
+	def test_timers_match_cpu(self):
+		# count DT down from 25 and keep every read; beep with ST 5
+		rom = bytes([0x60, 0x19, 0xf0, 0x15, 0x61, 0x05, 0xf1, 0x18, 0xa3, 0x00,
+			0xf2, 0x07, 0xf2, 0x55, 0x71, 0x01, 0x32, 0x00, 0x12, 0x0a, 0x00, 0xfd])
+		vec, cpus = self.lockstep(rom, [0], 1200)
+		cpu, backend = cpus[0]
+		self.assertEqual(vec.beeps[0], 1)
+		self.assertEqual(sum(1 for _, e in backend.events if e == 'beep'), 1)
+		self.assertTrue(vec.off[0])
+		self.assertEqual(vec.pc[0], 0x214)
+	
+	def test_keys_match_cpu(self):
+		# count presses of key 3 and releases of key 4, then wait for a key
+		rom = bytes([0x65, 0x03, 0x66, 0x04, 0xe5, 0x9e, 0x70, 0x01, 0xe6, 0xa1,
+			0x71, 0x01, 0xf2, 0x0a, 0x12, 0x04])
+		for keys in (0b1000, 0b10000, 0b11000, 0b1000000):
+			self.lockstep(rom, [0], 300, keys)
+	
+class StateTest(unittest.TestCase):
+	rom = bytes([
+		0xa0, 0x00, 0xd0, 0x15, 0x70, 0x01, 0xf0, 0x15, 0xf0, 0x33, 0x22, 0x10,
+		0x12, 0x02, 0x00, 0x00, 0x00, 0x00, 0x00, 0xee,
+	])
+	
+	def system(self):
+		sys = System(backend=Headless(), cpu_deterministic=True, cpu_throttle=False)
+		sys.load(self.rom)
+		return sys
+	
+	def state(self, sys):
+		cpu = sys.cpu
+		return (cpu.pc, cpu.sp, cpu.I, list(cpu.V), list(cpu.stack), cpu.cycles,
+			cpu.delay_timer.get(), bytes(sys.ram), list(sys.gfx.map))
+	
+	def test_roundtrip(self):
+		sys = self.system()
+		sys.cpu.run(0x200, 105)
+		blob = sys.snapshot()
+		saved = self.state(sys)
+		
+		sys.cpu.run(sys.cpu.pc, 200)
+		self.assertNotEqual(self.state(sys), saved)
+		sys.restore(blob)
+		self.assertEqual(self.state(sys), saved)
+	
+	def test_fork(self):
+		a = self.system()
+		a.cpu.run(0x200, 100)
+		b = self.system()
+		b.restore(a.snapshot())
+		a.cpu.run(a.cpu.pc, 100)
+		b.cpu.run(b.cpu.pc, 100)
+		self.assertEqual(self.state(a), self.state(b))
+	
+	def test_bad_blob(self):
+		sys = self.system()
+		blob = sys.snapshot()
+		with self.assertRaises(ValueError):
+			sys.restore(b'XXXX' + blob[4:])
+		other = System(backend=Headless(), cpu_stack_sz=16)
+		with self.assertRaises(ValueError):
+			other.restore(blob)
+	
+class RewindTest(unittest.TestCase):
+	rom = StateTest.rom
+	
+	def setUp(self):
+		from emul.rewind import Rewind
+		self.sys = System(backend=Headless(), cpu_deterministic=True, cpu_throttle=False, cpu_ips=60)
+		self.sys.load(self.rom)
+		self.rw = Rewind(self.sys, seconds=1, keyframe=8)
+		self.blobs = []
+		self.sys.cpu.frame_hooks.append(lambda cpu: self.blobs.append(self.sys.snapshot()))
+	
+	def test_state(self):
+		self.sys.cpu.run(0x200, 100)
+		self.assertEqual(len(self.rw), 60)
+		for back in (0, 1, 7, 8, 30, 59):
+			self.assertEqual(self.rw.state(back), self.blobs[-1 - back])
+		with self.assertRaises(IndexError):
+			self.rw.state(60)
+	
+	def test_rewind(self):
+		self.sys.cpu.run(0x200, 50)
+		self.rw.rewind(20)
+		self.assertEqual(self.sys.snapshot(), self.blobs[-21])
+		self.assertEqual(len(self.rw), 30)
+		
+		# history continues from the restored frame
+		self.blobs = self.blobs[:-20]
+		self.sys.cpu.run(self.sys.cpu.pc, 10)
+		for back in range(40):
+			self.assertEqual(self.rw.state(back), self.blobs[-1 - back])
+	
+	def test_large_state(self):
+		from emul.rewind import Group
+		key = bytes(0x20000)
+		delta = bytearray(len(key))
+		delta[0x1fff0] = 1
+		group = Group(key)
+		group.add(delta)
+		self.assertEqual(group.state(1), delta)
+	
+	def test_frame_rate(self):
+		sys = System(backend=Headless(), cpu_frame_hz=30, sys_rewind=2)
+		self.assertEqual(sys.rewind.capacity, 60)
+	
+class ReplayTest(unittest.TestCase):
+	rom = bytes([
+		0xc0, 0xff, 0xf1, 0x0a, 0x80, 0x14, 0xe1, 0x9e, 0x72, 0x01, 0xc3, 0xff,
+		0x80, 0x34, 0x12, 0x06,
+	])
+	
+	def test_rand_seed(self):
+		a, b, c = [System(backend=Headless(), cpu_deterministic=True, cpu_seed=s) for s in (1, 1, 2)]
+		for sys in (a, b, c):
+			for i in range(8):
+				sys.cpu.exe(0xc0ff + i * 0x100)
+		self.assertEqual(a.cpu.V, b.cpu.V)
+		self.assertNotEqual(a.cpu.V, c.cpu.V)
+	
+	def test_record_config(self):
+		# recording from the menu only sets sys_record
+		with tempfile.TemporaryDirectory() as d:
+			sys = System(backend=Headless(), cpu_throttle=False, sys_record=os.path.join(d, 'input.c8in'))
+			self.assertTrue(sys.cpu.deterministic)
+			self.assertIsNotNone(sys.recorder)
+	
+	def test_record_replay(self):
+		from emul.replay import Recorder, Log, replay
+		sys = System(backend=Headless(), cpu_deterministic=True, cpu_throttle=False, cpu_seed=7)
+		rec = Recorder(sys)
+		sys.load(self.rom)
+		
+		# the key wait consumes the first press
+		sys.kbd.press(sys.kbd.map.index(5))
+		sys.cpu.run(0x200, 100)
+		sys.kbd.release()
+		sys.cpu.run(sys.cpu.pc, 100)
+		sys.kbd.press(sys.kbd.map.index(5))
+		sys.cpu.run(sys.cpu.pc, 50)
+		
+		log = Log.loads(rec.log.dumps())
+		self.assertEqual(log.end, 250)
+		self.assertEqual([(c, k, f) for c, k, f in log.events],
+			[(0, 5, 3), (110, None, 0), (210, 5, 1)])
+		
+		again = replay(self.rom, log)
+		self.assertEqual(again.snapshot(), sys.snapshot())
+	
+class BatchTest(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.TemporaryDirectory()
+		roms = {
+			'spin': bytes([0x71, 0x01, 0x12, 0x00]),
+			'bad': bytes([0x00, 0xe0, 0xf0, 0x99]),
+			'deep': bytes([0x22, 0x00]),
+			'ret': bytes([0x00, 0xee]),
+		}
+		for name, rom in roms.items():
+			with open(os.path.join(self.dir.name, name), 'wb') as f:
+				f.write(rom)
+	
+	def tearDown(self):
+		self.dir.cleanup()
+	
+	def test_run_all(self):
+		import batch
+		paths = [os.path.join(self.dir.name, n) for n in ('bad', 'deep', 'ret', 'spin')]
+		bad, deep, ret, spin = batch.run_all(paths, 1000, {'cpu_throttle': False}, jobs=2)
+		
+		self.assertEqual(spin['cycles'], 1000)
+		self.assertIsNone(spin['fault'])
+		self.assertEqual(bad['unknown_opcodes'], 1)
+		self.assertIn('0202', bad['fault'])
+		self.assertEqual(deep['stack_overflows'], 1)
+		self.assertEqual(deep['cycles'], 24)
+		self.assertEqual(ret['stack_underflows'], 1)
+		self.assertEqual(ret['cycles'], 0)
+		self.assertEqual(spin['fb'], bad['fb'])
+	
+	def test_key_wait(self):
+		import batch
+		rec = batch.run('wait', bytes([0xf0, 0x0a, 0x12, 0x00]), 100, {'cpu_throttle': False})
+		self.assertTrue(rec['key_wait'])
+		self.assertIsNone(rec['fault'])
+		self.assertLess(rec['cycles'], 100)
+	
+	def test_pc_overflow(self):
+		import batch
+		rec = batch.run('end', bytes([0x1f, 0xff]), 100, {'cpu_throttle': False})
+		self.assertEqual(rec['pc_overflows'], 1)
+		self.assertIn('0fff', rec['fault'])
+	
+	def test_deterministic(self):
+		import batch
+		# random sprites at random places, paced by the delay timer
+		rom = bytes([0xc0, 0x3f, 0xc1, 0x1f, 0xc2, 0x0f, 0xf2, 0x29, 0xd0, 0x15,
+			0x63, 0x01, 0xf3, 0x15, 0xf3, 0x07, 0x33, 0x00, 0x12, 0x0e, 0x12, 0x00])
+		a = batch.run('rnd', rom, 5000, {'cpu_throttle': False})
+		b = batch.run('rnd', rom, 5000, {'cpu_throttle': False})
+		self.assertEqual(a['fb'], b['fb'])
+		c = batch.run('rnd', rom, 5000, {'cpu_throttle': False, 'cpu_seed': 7})
+		self.assertNotEqual(a['fb'], c['fb'])
+	
+	def test_run_corpus(self):
+		import batch
+		from emul.corpus import pack
+		path = os.path.join(self.dir.name, 'all.c8pk')
+		names = ['bad', 'deep', 'ret', 'spin']
+		roms = []
+		for name in names:
+			with open(os.path.join(self.dir.name, name), 'rb') as f:
+				roms.append((name, f.read()))
+		pack(path, roms)
+		
+		recs = batch.run_corpus(path, 1000, {'cpu_throttle': False}, jobs=2)
+		plain = batch.run_all([os.path.join(self.dir.name, n) for n in names], 1000, {'cpu_throttle': False}, jobs=2)
+		for a, b in zip(recs, plain):
+			del a['wall'], b['wall']
+			self.assertEqual(a, b)
+	
+	def test_matrix(self):
+		import batch
+		paths = [os.path.join(self.dir.name, n) for n in ('bad', 'spin')]
+		recs = batch.run_all(paths, 100, {'cpu_throttle': False, 'cpu_coverage': True}, jobs=2)
+		self.assertEqual(recs[0]['coverage']['fault']['pc'], '0202')
+		
+		path = os.path.join(self.dir.name, 'matrix.csv')
+		batch.write_matrix(path, recs)
+		with open(path) as f:
+			rows = f.read().splitlines()
+		self.assertEqual(len(rows), 3)
+		self.assertTrue(rows[1].startswith('bad,UnknownOpcode at 0202,'))
+	
+class CorpusTest(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.TemporaryDirectory()
+		self.path = os.path.join(self.dir.name, 'roms.c8pk')
+	
+	def tearDown(self):
+		self.dir.cleanup()
+	
+	def test_roundtrip(self):
+		from emul.corpus import Corpus, pack
+		pack(self.path, [('a', b'\x12\x00'), ('b\u00e9', bytes(range(100)))])
+		with Corpus(self.path) as corpus:
+			self.assertEqual(list(corpus), ['a', 'b\u00e9'])
+			rom = corpus['b\u00e9']
+			self.assertIsInstance(rom, memoryview)
+			
+			sys = System(backend=Headless())
+			sys.load(rom)
+			self.assertEqual(sys.ram[0x200:0x264], bytes(range(100)))
+			rom.release()
+	
+	def test_limits(self):
+		from emul.corpus import Corpus, pack
+		with self.assertRaises(ValueError):
+			pack(self.path, [('big', bytes(3585))], limit=4096 - 0x200)
+		
+		pack(self.path, [('big', bytes(3585))])
+		with Corpus(self.path) as corpus:
+			rom = corpus['big']
+			with self.assertRaises(ValueError):
+				System(backend=Headless()).load(rom)
+			rom.release()
+		
+		with open(self.path, 'r+b') as f:
+			f.truncate(100)
+		with self.assertRaises(ValueError):
+			Corpus(self.path)
+	
+class BenchTest(unittest.TestCase):
+	def test_bench(self):
+		import bench
+		results = bench.bench(2000, {}, repeat=1, names=['alu', 'call'])
+		self.assertEqual(sorted(results), ['alu', 'call'])
+		self.assertEqual(results['alu']['instructions'], 2000)
+		self.assertGreater(results['call']['mips'], 0)
+		
+		base = {'alu': dict(results['alu'], ns_per_ins=results['alu']['ns_per_ins'] / 2)}
+		self.assertEqual(list(bench.compare(results, base)), ['alu'])
+		self.assertEqual(bench.compare(results, results), {})
+	
+class RomCacheTest(unittest.TestCase):
+	files = {'/list': b'a\nb\n', '/a': b'\x12\x00', '/b': b'\x00\xe0' * 8}
+	
+	def setUp(self):
+		import hashlib
+		import http.server
+		
+		test = self
+		self.hits = []
+		self.conns = 0
+		self.etag = 'ETag'
+		
+		class Handler(http.server.BaseHTTPRequestHandler):
+			protocol_version = 'HTTP/1.1'
+			
+			def setup(self):
+				test.conns += 1
+				super().setup()
+			
+			def do_GET(self):
+				body = test.files.get(self.path)
+				test.hits.append((self.path, self.headers.get('If-None-Match')))
+				if body is None:
+					self.send_error(404)
+					return
+				etag = '"%s"' % hashlib.sha1(body).hexdigest()
+				if self.headers.get('If-None-Match') == etag:
+					self.send_response(304)
+					self.send_header(test.etag, etag)
+					self.end_headers()
+					return
+				self.send_response(200)
+				self.send_header(test.etag, etag)
+				self.send_header('Content-Length', str(len(body)))
+				self.end_headers()
+				self.wfile.write(body)
+			
+			def log_message(self, *args):
+				pass
+		
+		self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+		self.server.daemon_threads = True
+		self.url = 'http://127.0.0.1:%d' % self.server.server_port
+		threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+		self.dir = tempfile.TemporaryDirectory()
+	
+	def tearDown(self):
+		self.server.shutdown()
+		self.server.server_close()
+		self.dir.cleanup()
+	
+	def test_revalidate(self):
+		from romcache import RomCache
+		cache = RomCache(self.dir.name, age=0)
+		self.assertEqual(cache.get(self.url + '/list'), b'a\nb\n')
+		self.assertEqual(cache.get(self.url + '/list'), b'a\nb\n')
+		self.assertIsNone(self.hits[0][1])
+		self.assertIsNotNone(self.hits[1][1])
+		
+		# changed content replaces the cached copy
+		self.files = dict(self.files, **{'/list': b'c\n'})
+		self.assertEqual(cache.get(self.url + '/list'), b'c\n')
+		self.assertEqual(len(os.listdir(os.path.join(self.dir.name, 'blobs'))), 1)
+	
+	def test_header_case(self):
+		from romcache import RomCache, Connections, urlfetch
+		self.etag = 'etag'
+		conns = Connections()
+		for i, fetch in enumerate((urlfetch, conns.fetch)):
+			cache = RomCache(os.path.join(self.dir.name, str(i)), age=0, fetch=fetch)
+			cache.get(self.url + '/a')
+			cache.get(self.url + '/a')
+			self.assertIsNotNone(self.hits[-1][1])
+		conns.close()
+	
+	def test_fresh_and_offline(self):
+		from romcache import RomCache
+		cache = RomCache(self.dir.name)
+		cache.get(self.url + '/a')
+		cache.get(self.url + '/a')
+		self.assertEqual(len(self.hits), 1)
+		
+		# a new instance reads the index back and works without a server
+		self.server.shutdown()
+		self.server.server_close()
+		cache = RomCache(self.dir.name, age=0, timeout=0.5)
+		self.assertEqual(cache.get(self.url + '/a'), b'\x12\x00')
+		self.assertIsNone(cache.get(self.url + '/b'))
+	
+	def test_evict(self):
+		from romcache import RomCache
+		cache = RomCache(self.dir.name, size=17)
+		cache.get(self.url + '/a')
+		cache.get(self.url + '/b')
+		self.assertEqual(list(cache.index), [self.url + '/b'])
+		cache.get(self.url + '/a')
+		self.assertEqual(list(cache.index), [self.url + '/a'])
+	
+	def test_loader(self):
+		from romcache import RomCache, Connections, Loader
+		conns = Connections(2)
+		cache = RomCache(self.dir.name, age=0, fetch=conns.fetch)
+		loader = Loader(cache, 2)
+		self.assertEqual(loader.list(self.url + '/', 'list').result(), ['a', 'b'])
+		self.assertEqual(loader.rom(self.url + '/b'), b'\x00\xe0' * 8)
+		self.assertEqual(loader.rom(self.url + '/a'), b'\x12\x00')
+		self.assertEqual(sorted(p for p, _ in self.hits), ['/a', '/b', '/list'])
+		# prefetched roms come from memory, over reused connections
+		self.assertEqual(loader.rom(self.url + '/a'), b'\x12\x00')
+		self.assertEqual(len(self.hits), 3)
+		self.assertLessEqual(self.conns, 2)
+		
+		# a revalidation reuses an idle connection
+		cache.get(self.url + '/list')
+		self.assertEqual(self.hits[-1][0], '/list')
+		self.assertLessEqual(self.conns, 2)
+		loader.close()
+		conns.close()
+	
+	def test_corrupt(self):
+		from romcache import RomCache
+		cache = RomCache(self.dir.name)
+		cache.get(self.url + '/a')
+		with open(cache.blob(cache.index[self.url + '/a']['hash']), 'wb') as f:
+			f.write(b'junk')
+		self.assertEqual(cache.get(self.url + '/a'), b'\x12\x00')
+		self.assertEqual(len(self.hits), 2)
+	
+class ExportTest(unittest.TestCase):
+	# draw digit 0, then spin
+	rom = bytes([0xa0, 0x00, 0xd0, 0x05, 0x12, 0x04])
+	
+	def setUp(self):
+		self.dir = tempfile.TemporaryDirectory()
+	
+	def tearDown(self):
+		self.dir.cleanup()
+	
+	def export(self, fmt, name):
+		path = os.path.join(self.dir.name, name)
+		sys = System(backend=Headless(), cpu_throttle=False, cpu_idle_skip=False,
+			sys_export=path, sys_export_fmt=fmt, sys_export_scale=1)
+		sys.start(self.rom, 100)
+		self.assertEqual(sys.cpu.frames, 10)
+		return path
+	
+	def unlzw(self, data, min_size):
+		clear = 1 << min_size
+		acc = int.from_bytes(data, 'little')
+		pos, size, out, prev = 0, min_size + 1, bytearray(), None
+		while True:
+			code = acc >> pos & (1 << size) - 1
+			pos += size
+			if code == clear:
+				table = [bytes([i]) for i in range(clear)] + [b'', b'']
+				size, prev = min_size + 1, None
+				continue
+			if code == clear + 1:
+				return bytes(out)
+			if prev is None:
+				entry = table[code]
+			else:
+				entry = table[code] if code < len(table) else table[prev] + table[prev][:1]
+				table.append(table[prev] + entry[:1])
+			out += entry
+			prev = code
+			if len(table) >= 1 << size and size < 12:
+				size += 1
+	
+	def test_raw(self):
+		from emul.export import raw_frame
+		with open(self.export('raw', 'frames.raw'), 'rb') as f:
+			data = f.read()
+		size = raw_frame.size + 8 * 32
+		self.assertEqual(len(data), 10 * size)
+		self.assertEqual(raw_frame.unpack_from(data), (64, 32))
+		self.assertEqual(data[raw_frame.size], 0xf0)
+	
+	def test_png(self):
+		import zlib
+		path = self.export('png', 'frames')
+		self.assertEqual(len(os.listdir(path)), 10)
+		with open(os.path.join(path, '000000.png'), 'rb') as f:
+			data = f.read()
+		self.assertTrue(data.startswith(b'\x89PNG\r\n\x1a\n'))
+		# 64x32 lores pixels scaled to 128x64, one filter byte per row
+		self.assertEqual(data[16:24], bytes([0, 0, 0, 128, 0, 0, 0, 64]))
+		n = int.from_bytes(data[33:37], 'big')
+		rows = zlib.decompress(data[41:41+n])
+		self.assertEqual(len(rows), 64 * 17)
+		self.assertEqual(rows[:3], bytes([0, 0xff, 0]))
+	
+	def test_gif(self):
+		with open(self.export('gif', 'frames.gif'), 'rb') as f:
+			data = f.read()
+		self.assertTrue(data.startswith(b'GIF89a'))
+		self.assertEqual(data[-1], 0x3b)
+		
+		def blocks(pos):
+			body = bytearray()
+			while data[pos]:
+				body += data[pos+1:pos+1+data[pos]]
+				pos += 1 + data[pos]
+			return pos + 1, bytes(body)
+		
+		# walk the extensions and images after the header and palette
+		pos, images, delays = 13 + 6, [], []
+		while data[pos] != 0x3b:
+			if data[pos] == 0x21:
+				label = data[pos+1]
+				pos, body = blocks(pos + 2)
+				if label == 0xf9:
+					delays.append(int.from_bytes(body[1:3], 'little'))
+			else:
+				min_size = data[pos+10]
+				pos, body = blocks(pos + 11)
+				images.append(self.unlzw(body, min_size))
+		
+		# the frame is the same from the first tick on
+		self.assertEqual(len(images), 1)
+		self.assertEqual(sum(delays), 10 * 100 // 60)
+		pixels = images[0]
+		self.assertEqual(len(pixels), 128 * 64)
+		self.assertEqual(pixels[:10], bytes([1] * 8 + [0] * 2))
+		self.assertEqual(sum(pixels), 2 * 2 * 14)
+	
+	def test_full_queue(self):
+		from emul.export import Exporter, raw_frame
+		gate = threading.Event()
+		
+		class Slow(Exporter):
+			def write_raw(self):
+				gate.wait()
+				super().write_raw()
+		
+		path = os.path.join(self.dir.name, 'frames.raw')
+		sys = System(backend=Headless())
+		exp = Slow(sys, path, 'raw', queue_sz=2)
+		for _ in range(5):
+			sys.cpu.frame()
+		self.assertEqual((exp.frames, exp.dropped), (5, 3))
+		gate.set()
+		exp.close()
+		self.assertEqual(os.path.getsize(path), 2 * (raw_frame.size + 8 * 32))
+	
+	def test_lzw(self):
+		import random
+		from emul.export import lzw
+		rand = random.Random(0)
+		for n in (0, 1, 5000, 20000):
+			pixels = bytes(rand.getrandbits(1) for _ in range(n))
+			self.assertEqual(self.unlzw(lzw(pixels, 2), 2), pixels)
+		self.assertEqual(self.unlzw(lzw(bytes(50000), 2), 2), bytes(50000))
+	
 if __name__ == '__main__':
 	unittest.main()